@@ -0,0 +1,112 @@
+import collections
+import math
+
+import numpy as np
+
+# Multi-frame measurement with an early-stop rule.
+#
+# Consecutive frame pairs are measured and every dimension is aggregated with
+# a robust estimator (median or trimmed mean). After each frame the 95%
+# confidence interval of every dimension is recomputed, and measurement stops
+# as soon as all half-widths are within the tolerance, or after max_frames.
+# Stable parts therefore finish after min_frames, noisy ones take longer.
+
+# Two-sided 95% Student t quantiles for 1..30 degrees of freedom
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+
+def t_quantile(df):
+    return T_95[df - 1] if df <= len(T_95) else 1.96
+
+def trimmed_mean(values, trim=0.2):
+    values = np.sort(np.asarray(values, dtype=float))
+    g = int(trim * len(values))
+    return float(values[g:len(values) - g].mean())
+
+# Estimate and 95% half-width. The trimmed mean uses the winsorized variance
+# (Tukey-McLaughlin); the median uses the MAD-based asymptotic standard error.
+def robust_interval(values, estimator="median", trim=0.2):
+    values = np.sort(np.asarray(values, dtype=float))
+    n = len(values)
+    if n < 2:
+        return float(values[0]) if n else math.nan, math.inf
+    if estimator == "median":
+        median = float(np.median(values))
+        sigma = 1.4826 * float(np.median(np.abs(values - median)))
+        return median, t_quantile(n - 1) * 1.2533 * sigma / math.sqrt(n)
+    g = int(trim * n)
+    winsorized = np.clip(values, values[g], values[n - 1 - g])
+    h = n - 2 * g
+    standard_error = math.sqrt(winsorized.var(ddof=1)) / ((1 - 2 * trim) * math.sqrt(n))
+    return float(values[g:n - g].mean()), t_quantile(max(h - 1, 1)) * standard_error
+
+# Flat {name: value} view of one measurement; names carry the shape so that
+# frames classified differently are never mixed
+def measurement_values(shape, dimensions, height_cm):
+    values = {"height": float(height_cm)}
+    if shape == "Rectangle":
+        values["Rectangle.width"], values["Rectangle.height"] = (float(d) for d in dimensions)
+    elif shape == "Circle":
+        values["Circle.diameter"] = float(dimensions)
+    return values
+
+class MeasurementAggregator:
+    def __init__(self, tolerance_cm=0.05, min_frames=3, max_frames=30, estimator="median", trim=0.2):
+        self.tolerance_cm = tolerance_cm
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.estimator = estimator
+        self.trim = trim
+        self.frames = 0
+        self.shapes = collections.Counter()
+        self.samples = collections.defaultdict(list)
+
+    def add(self, shape, dimensions, height_cm):
+        self.frames += 1
+        self.shapes[shape] += 1
+        for name, value in measurement_values(shape, dimensions, height_cm).items():
+            self.samples[name].append(value)
+
+    # Most frequent top-view shape over the frames so far
+    def shape(self):
+        return self.shapes.most_common(1)[0][0] if self.shapes else None
+
+    def intervals(self):
+        shape = self.shape()
+        return {name: robust_interval(values, self.estimator, self.trim)
+                for name, values in self.samples.items()
+                if name == "height" or name.startswith(f"{shape}.")}
+
+    def converged(self):
+        if self.shapes[self.shape()] < self.min_frames:
+            return False
+        return all(half_width <= self.tolerance_cm for _, half_width in self.intervals().values())
+
+    def done(self):
+        return self.frames >= self.max_frames or self.converged()
+
+    # (shape, dimensions, height_cm, half_widths) with dimensions in the form
+    # classify_and_measure uses
+    def result(self):
+        shape = self.shape()
+        intervals = self.intervals()
+        if shape == "Rectangle":
+            dimensions = (intervals["Rectangle.width"][0], intervals["Rectangle.height"][0])
+        elif shape == "Circle":
+            dimensions = intervals["Circle.diameter"][0]
+        else:
+            dimensions = None
+        height_cm = intervals["height"][0] if "height" in intervals else math.nan
+        return shape, dimensions, height_cm, {name: half_width for name, (_, half_width) in intervals.items()}
+
+# Feeds measure(pair) -> (shape, dimensions, height_cm) with pairs until the
+# aggregator is done; returns the aggregator
+def measure_until_stable(pairs, measure, aggregator):
+    for pair in pairs:
+        if pair is None:
+            continue
+        aggregator.add(*measure(pair))
+        if aggregator.done():
+            break
+    return aggregator
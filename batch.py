@@ -0,0 +1,267 @@
+import argparse
+import functools
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from calibration import load_profile
+from lens import profile_measurements
+from measurement import (
+    process_top_frame,
+    calculate_object_distance_from_box_bottom,
+    calculate_object_height,
+)
+from pyramid import calculate_object_height_pyramid, process_top_frame_pyramid
+from recording import RecordedStream, replay_pairs
+from segmentation import get_default_segmenter
+from tracking import RoiTracker, track_top_frame, track_side_frame
+
+# Headless batch measurement of archived captures.
+#
+# Image mode pairs "<name>_top.<ext>" with "<name>_side.<ext>" in one folder,
+# video mode pairs frame N of the top video with frame N of the side video,
+# recording mode pairs each top frame of a recording.py directory with the
+# side frame closest in time.
+# Work is spread over a process pool; each worker reads its own input so that
+# frames never have to be pickled between processes.
+
+AB_cm = 9
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+def init_worker():
+    # One OpenCV thread per process, otherwise N workers each spawn N threads
+    # and the pool stops scaling with cores
+    cv2.setNumThreads(1)
+    # Colour tables (segmentation.py) are built now, not in the first measurement
+    get_default_segmenter()
+
+# trackers is an optional (top, side) pair of RoiTrackers for consecutive
+# frames; levels > 0 detects on that pyramid level and refines at full
+# resolution (pyramid.py) instead
+def measure_pair(top_frame, side_frame, ab_cm=AB_cm, profile=None, trackers=None, levels=0):
+    if levels:
+        return measure_pair_pyramid(top_frame, side_frame, ab_cm, profile, levels)
+    if profile is None:
+        if trackers:
+            top_result = track_top_frame(top_frame, trackers[0])
+        else:
+            top_result = process_top_frame(top_frame, draw=False)
+        _, top_segmented, top_shape, top_dimensions, top_shapes_within, pixel_to_cm_ratio, x, y, w, h = top_result
+        distance_from_box_bottom_cm = calculate_object_distance_from_box_bottom(top_segmented, pixel_to_cm_ratio, y)
+        if trackers:
+            side_height, _ = track_side_frame(side_frame, trackers[1], ab_cm, distance_from_box_bottom_cm)
+        else:
+            side_height, _ = calculate_object_height(side_frame, ab_cm, distance_from_box_bottom_cm)
+    else:
+        # The stored box ROI already limits the top view; only the side view
+        # is tracked, unless it is lens-corrected, which crops it already
+        top_fn, side_fn = profile_measurements(profile)
+        _, _, top_shape, top_dimensions, top_shapes_within, pixel_to_cm_ratio, x, y, w, h = top_fn(top_frame, profile["top"], draw=False)
+        side = profile["side"]
+        if trackers and not side.get("lens"):
+            side_height, _ = track_side_frame(side_frame, trackers[1], side["ab_cm"], side["offset_cm"], side["ab_pixels"])
+        else:
+            side_height, _ = side_fn(side_frame, side["ab_cm"], side["offset_cm"], side["ab_pixels"])
+    return pair_record(top_shape, top_dimensions, top_shapes_within, side_height, pixel_to_cm_ratio, x, y, w, h)
+
+def measure_pair_pyramid(top_frame, side_frame, ab_cm, profile, levels):
+    if profile is None:
+        _, top_segmented, top_shape, top_dimensions, top_shapes_within, pixel_to_cm_ratio, x, y, w, h = \
+            process_top_frame_pyramid(top_frame, levels=levels, draw=False)
+        distance_from_box_bottom_cm = calculate_object_distance_from_box_bottom(top_segmented, pixel_to_cm_ratio, y)
+        side_height, _ = calculate_object_height_pyramid(side_frame, ab_cm, distance_from_box_bottom_cm, levels=levels)
+    else:
+        top_fn, side_fn = profile_measurements(profile, functools.partial(process_top_frame_pyramid, levels=levels),
+                                               functools.partial(calculate_object_height_pyramid, levels=levels))
+        _, _, top_shape, top_dimensions, top_shapes_within, pixel_to_cm_ratio, x, y, w, h = \
+            top_fn(top_frame, profile["top"], draw=False)
+        side = profile["side"]
+        side_height, _ = side_fn(side_frame, side["ab_cm"], side["offset_cm"], side["ab_pixels"])
+    return pair_record(top_shape, top_dimensions, top_shapes_within, side_height, pixel_to_cm_ratio, x, y, w, h)
+
+def pair_record(top_shape, top_dimensions, top_shapes_within, side_height, pixel_to_cm_ratio, x, y, w, h):
+    return {
+        "shape": top_shape,
+        "dimensions": top_dimensions,
+        "shapes_within": [{"shape": shape, "dimensions": dimensions} for shape, dimensions in top_shapes_within],
+        "height_cm": float(side_height),
+        "pixel_to_cm_ratio": float(pixel_to_cm_ratio),
+        "box": [int(x), int(y), int(w), int(h)],
+    }
+
+def safe_measure_pair(top_frame, side_frame, ab_cm=AB_cm, profile=None, trackers=None, levels=0):
+    try:
+        record = measure_pair(top_frame, side_frame, ab_cm, profile, trackers, levels)
+    except Exception as exc:  # A bad capture must not abort the whole run
+        if trackers:
+            for tracker in trackers:
+                tracker.reset()
+        record = {"error": f"{type(exc).__name__}: {exc}"}
+    if profile is not None:
+        record["calibration_id"] = profile["calibration_id"]
+    return record
+
+def find_image_pairs(directory):
+    pairs = []
+    for filename in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() not in IMAGE_EXTENSIONS or not stem.endswith("_top"):
+            continue
+        name = stem[:-len("_top")]
+        for side_ext in (ext,) + IMAGE_EXTENSIONS:
+            side_path = os.path.join(directory, name + "_side" + side_ext)
+            if os.path.exists(side_path):
+                pairs.append((name, os.path.join(directory, filename), side_path))
+                break
+    return pairs
+
+def measure_image_pair(job):
+    name, top_path, side_path, ab_cm, profile, levels = job
+    top_frame = cv2.imread(top_path)
+    side_frame = cv2.imread(side_path)
+    if top_frame is None or side_frame is None:
+        record = {"error": "could not read image pair"}
+    else:
+        record = safe_measure_pair(top_frame, side_frame, ab_cm, profile, levels=levels)
+    record["pair"] = name
+    return record
+
+# True when a CAP_PROP_POS_FRAMES seek lands exactly on frame `index`.
+# These seeks are not frame-accurate for every codec, so a seek is only
+# trusted when the capture reports landing on the frame.
+def seek_video(cap, index):
+    return cap.set(cv2.CAP_PROP_POS_FRAMES, index) and int(round(cap.get(cv2.CAP_PROP_POS_FRAMES))) == index
+
+# Capture positioned so that the next read() returns frame `index`; when the
+# seek misses, the video is decoded from the start and skipped with grab()
+def open_video_at(path, index):
+    cap = cv2.VideoCapture(path)
+    if index and not seek_video(cap, index):
+        cap.release()
+        cap = cv2.VideoCapture(path)
+        for _ in range(index):
+            if not cap.grab():
+                break
+    return cap
+
+def measure_video_chunk(job):
+    top_path, side_path, start, stop, ab_cm, profile, track, levels = job
+    cap_top = open_video_at(top_path, start)
+    cap_side = open_video_at(side_path, start)
+    # Consecutive video frames are what ROI tracking is for
+    trackers = (RoiTracker(), RoiTracker()) if track else None
+    records = []
+    # stop is None when the length is unknown: read to the end of the videos
+    for index in range(start, stop) if stop is not None else itertools.count(start):
+        ret_top, top_frame = cap_top.read()
+        ret_side, side_frame = cap_side.read()
+        if not (ret_top and ret_side):
+            break
+        record = safe_measure_pair(top_frame, side_frame, ab_cm, profile, trackers, levels)
+        record["pair"] = index
+        records.append(record)
+    cap_top.release()
+    cap_side.release()
+    return records
+
+def measure_recording_chunk(job):
+    directory, start, stop, max_skew, ab_cm, profile, track, levels = job
+    trackers = (RoiTracker(), RoiTracker()) if track else None
+    records = []
+    # Workers read straight from the memory-mapped frame store
+    for pair in replay_pairs(directory, max_skew, start, stop):
+        record = safe_measure_pair(pair.top, pair.side, ab_cm, profile, trackers, levels)
+        record["pair"] = pair.top_time
+        records.append(record)
+    return records
+
+# Frame count (0 when the container does not report it) and whether
+# seeking into the video is frame-accurate
+def video_info(path):
+    cap = cv2.VideoCapture(path)
+    count = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    seekable = count > 1 and seek_video(cap, count // 2)
+    cap.release()
+    return count, seekable
+
+def run_images(directory, workers, ab_cm, out, profile=None, levels=0):
+    jobs = [(name, top_path, side_path, ab_cm, profile, levels) for name, top_path, side_path in find_image_pairs(directory)]
+    chunksize = max(1, len(jobs) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        for record in pool.map(measure_image_pair, jobs, chunksize=chunksize):
+            out.write(json.dumps(record) + "\n")
+    return len(jobs)
+
+def run_videos(top_path, side_path, workers, ab_cm, out, chunk_frames, profile=None, track=False, levels=0):
+    (top_count, top_seekable), (side_count, side_seekable) = video_info(top_path), video_info(side_path)
+    frame_count = min(top_count, side_count)
+    if not frame_count:
+        # Length unknown: a single task reads both videos to the end
+        jobs = [(top_path, side_path, 0, None, ab_cm, profile, track, levels)]
+    else:
+        if not (top_seekable and side_seekable):
+            # A task that cannot seek decodes every frame before its range, so
+            # the videos are split into one range per worker instead of chunks
+            chunk_frames = max(chunk_frames, -(-frame_count // workers))
+        # Each worker decodes its own contiguous range of frames, seeking once
+        jobs = [(top_path, side_path, start, min(start + chunk_frames, frame_count), ab_cm, profile, track, levels)
+                for start in range(0, frame_count, chunk_frames)]
+    measured = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        for records in pool.map(measure_video_chunk, jobs):
+            for record in records:
+                out.write(json.dumps(record) + "\n")
+            measured += len(records)
+    return measured
+
+def run_recording(directory, workers, ab_cm, out, chunk_frames, max_skew, profile=None, track=False, levels=0):
+    frame_count = len(RecordedStream(directory, "top"))
+    jobs = [(directory, start, min(start + chunk_frames, frame_count), max_skew, ab_cm, profile, track, levels)
+            for start in range(0, frame_count, chunk_frames)]
+    measured = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        for records in pool.map(measure_recording_chunk, jobs):
+            for record in records:
+                out.write(json.dumps(record) + "\n")
+            measured += len(records)
+    return measured
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure archived top/side captures without the GUI.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--images", metavar="DIR", help="folder of <name>_top / <name>_side image pairs")
+    source.add_argument("--videos", nargs=2, metavar=("TOP", "SIDE"), help="recorded top and side video files")
+    source.add_argument("--recording", metavar="DIR", help="synchronized recording made by recording.py")
+    parser.add_argument("--output", "-o", help="JSON-lines output file (default: stdout)")
+    parser.add_argument("--workers", "-j", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--ab-cm", type=float, default=AB_cm, help="length of the side-view reference bar in cm")
+    parser.add_argument("--profile", help="calibration profile to use instead of per-frame reference detection")
+    parser.add_argument("--track", action="store_true", help="video/recording mode: process only a window around the last box/object position")
+    parser.add_argument("--chunk-frames", type=int, default=64, help="frames per worker task in video and recording mode")
+    parser.add_argument("--max-skew", type=float, default=0.010, help="recording mode: largest top/side time difference in seconds")
+    parser.add_argument("--pyramid", type=int, default=0, metavar="LEVELS",
+                        help="detect on a frame halved LEVELS times and refine edges at full resolution")
+    args = parser.parse_args(argv)
+    if args.pyramid and args.track:
+        parser.error("--pyramid and --track cannot be combined")
+
+    profile = load_profile(args.profile) if args.profile else None
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        if args.images:
+            count = run_images(args.images, args.workers, args.ab_cm, out, profile, args.pyramid)
+        elif args.recording:
+            count = run_recording(args.recording, args.workers, args.ab_cm, out, args.chunk_frames, args.max_skew, profile, args.track, args.pyramid)
+        else:
+            count = run_videos(args.videos[0], args.videos[1], args.workers, args.ab_cm, out, args.chunk_frames, profile, args.track, args.pyramid)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Measured {count} pairs", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
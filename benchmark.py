@@ -0,0 +1,225 @@
+import argparse
+import json
+import math
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from measurement import (
+    classify_and_measure,
+    classify_contours,
+    contour_stats,
+    process_top_frame,
+    calculate_object_height,
+    threshold_top,
+)
+from pyramid import calculate_object_height_pyramid, process_top_frame_pyramid
+
+# Synthetic-scene benchmark and accuracy check for the measurement functions.
+#
+# Top scenes are a filled 10 cm black box with a bright part of known size on
+# it, pierced by a grid of rectangular and circular holes of known size. Side
+# scenes are a white floor with a dark AB reference bar and an orange object
+# of known height. Every function is timed on fresh copies of the scene at
+# several resolutions and hole counts, and the measured dimensions are
+# compared with the ground truth the scene was rendered from. A saved run
+# can be used as baseline to fail on latency or accuracy regressions.
+# With --pyramid the top and side columns are the coarse-to-fine functions
+# of pyramid.py.
+
+BOX_CM = 10.0
+AB_cm = 9
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+HOLE_COUNTS = [4, 36, 256]
+ORANGE_BGR = (0, 128, 255)
+
+def render_top_scene(resolution, holes):
+    width, height = resolution
+    frame = np.full((height, width, 3), 255, dtype=np.uint8)
+    box_px = int(height * 0.8)
+    ratio = box_px / BOX_CM
+    x0, y0 = (width - box_px) // 2, (height - box_px) // 2
+    cv2.rectangle(frame, (x0, y0), (x0 + box_px - 1, y0 + box_px - 1), (0, 0, 0), -1)
+
+    # Bright 7 x 6 cm part in the middle of the box
+    part_cm = (7.0, 6.0)
+    part_w, part_h = round(part_cm[0] * ratio), round(part_cm[1] * ratio)
+    px, py = x0 + (box_px - part_w) // 2, y0 + (box_px - part_h) // 2
+    cv2.rectangle(frame, (px, py), (px + part_w - 1, py + part_h - 1), (255, 255, 255), -1)
+
+    # Square grid of holes, alternating circles and rectangles
+    truth = []
+    per_row = math.ceil(math.sqrt(holes))
+    cell_w, cell_h = part_w / (per_row + 1), part_h / (per_row + 1)
+    size_px = 0.45 * min(cell_w, cell_h)
+    for i in range(holes):
+        cx = int(px + cell_w * (i % per_row + 1))
+        cy = int(py + cell_h * (i // per_row + 1))
+        if i % 2:
+            radius = max(2, int(size_px / 2))
+            cv2.circle(frame, (cx, cy), radius, (0, 0, 0), -1)
+            truth.append(("Circle", (2 * radius + 1) / ratio))
+        else:
+            w, h = max(3, int(size_px)), max(2, int(size_px * 0.6))
+            cv2.rectangle(frame, (cx - w // 2, cy - h // 2), (cx - w // 2 + w - 1, cy - h // 2 + h - 1), (0, 0, 0), -1)
+            truth.append(("Rectangle", (w / ratio, h / ratio)))
+    return frame, {"part": ("Rectangle", (part_w / ratio, part_h / ratio)), "holes": truth}
+
+def render_side_scene(resolution, object_cm=4.0):
+    width, height = resolution
+    frame = np.full((height, width, 3), 255, dtype=np.uint8)
+    ab_px = int(height * 0.6)
+    x_ref, top = width // 10, (height - ab_px) // 2
+    cv2.rectangle(frame, (x_ref, top), (x_ref + width // 60, top + ab_px - 1), (0, 0, 0), -1)
+    object_px = round(object_cm * ab_px / AB_cm)
+    bottom = top + ab_px - 1
+    cv2.rectangle(frame, (width // 3, bottom - object_px + 1), (width // 3 + width // 4, bottom), ORANGE_BGR, -1)
+    return frame, object_px * AB_cm / ab_px
+
+# Median and 95th percentile latency in milliseconds; each call gets a fresh
+# copy of the frame, like a newly captured one that is not yet in cache
+def time_calls(fn, frame, repeat):
+    copies = [frame.copy() for _ in range(repeat)]
+    fn(frame.copy())
+    timings = []
+    for copy in copies:
+        start = time.perf_counter()
+        fn(copy)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+def dimension_error(shape, dimensions, truth):
+    truth_shape, truth_dimensions = truth
+    if shape != truth_shape:
+        return math.inf
+    return float(np.max(np.abs(np.subtract(dimensions, truth_dimensions))))
+
+# Largest error between measured and rendered holes, matched per shape in
+# order of size, and the number of rendered holes that found no measured
+# hole of the same shape (missed or misclassified)
+def holes_error(shapes_within, truth):
+    worst, missed = 0.0, 0
+    for shape in ("Rectangle", "Circle"):
+        measured = sorted(np.atleast_1d(d).tolist() for s, d in shapes_within if s == shape)
+        expected = sorted(np.atleast_1d(d).tolist() for s, d in truth if s == shape)
+        missed += max(0, len(expected) - len(measured))
+        for m, e in zip(measured, expected):
+            worst = max(worst, float(np.max(np.abs(np.subtract(m, e)))))
+    return worst, missed
+
+def contours_of(frame):
+    contours, _ = cv2.findContours(threshold_top(frame), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
+def run(resolutions, hole_counts, repeat, levels=0):
+    if levels:
+        def top_fn(frame):
+            return process_top_frame_pyramid(frame, levels=levels)
+
+        def side_fn(frame):
+            return calculate_object_height_pyramid(frame, AB_cm, 0, levels=levels)
+    else:
+        top_fn = process_top_frame
+
+        def side_fn(frame):
+            return calculate_object_height(frame, AB_cm, 0)
+    results = []
+    for resolution in resolutions:
+        side_frame, side_truth = render_side_scene(resolution)
+        side_latency = time_calls(side_fn, side_frame, repeat)
+        side_height, _ = side_fn(side_frame)
+        for holes in hole_counts:
+            top_frame, truth = render_top_scene(resolution, holes)
+            result = top_fn(top_frame)
+            shape, dimensions, shapes_within, ratio = result[2], result[3], result[4], result[5]
+
+            holes_error_cm, holes_missed = holes_error(shapes_within, truth["holes"])
+
+            contours = contours_of(top_frame)
+            stats = contour_stats(contours)
+            per_contour = time_calls(lambda f: [classify_and_measure(c, ratio) for c in contours], top_frame, repeat)
+            batched = time_calls(lambda f: classify_contours(contours, ratio, stats), top_frame, repeat)
+            results.append({
+                "resolution": f"{resolution[0]}x{resolution[1]}",
+                "holes": holes,
+                "contours": len(contours),
+                "process_top_frame_ms": time_calls(top_fn, top_frame, repeat),
+                "classify_and_measure_ms": per_contour,
+                "classify_contours_ms": batched,
+                "calculate_object_height_ms": side_latency,
+                "scale_error_pct": abs(ratio / (int(resolution[1] * 0.8) / BOX_CM) - 1) * 100,
+                "part_error_cm": dimension_error(shape, dimensions, truth["part"]),
+                "holes_error_cm": holes_error_cm,
+                "holes_missed": holes_missed,
+                "height_error_cm": abs(side_height - side_truth),
+            })
+    return results
+
+def print_table(results, out=sys.stdout):
+    header = ("resolution", "holes", "top p50", "top p95", "classify", "batched", "side p50",
+              "part err", "holes err", "missed", "height err")
+    out.write("{:>10} {:>6} {:>8} {:>8} {:>9} {:>8} {:>8} {:>9} {:>9} {:>6} {:>10}\n".format(*header))
+    for r in results:
+        out.write("{:>10} {:>6} {:>8.2f} {:>8.2f} {:>9.2f} {:>8.2f} {:>8.2f} {:>9.3f} {:>9.3f} {:>6} {:>10.3f}\n".format(
+            r["resolution"], r["holes"], *r["process_top_frame_ms"], r["classify_and_measure_ms"][0],
+            r["classify_contours_ms"][0], r["calculate_object_height_ms"][0],
+            r["part_error_cm"], r["holes_error_cm"], r["holes_missed"], r["height_error_cm"]))
+    out.write("(latencies in ms, errors in cm)\n")
+
+# Regressions against a baseline run: median latency above baseline * (1 +
+# slack) and more than min_slack_ms above it, more missed holes than the
+# baseline, or a measurement error more than error_slack_cm above the
+# baseline's. max_error_cm, if given, is an absolute limit on every error.
+def regressions(results, baseline, slack, max_error_cm=None, min_slack_ms=0.5, error_slack_cm=0.02):
+    previous = {(r["resolution"], r["holes"]): r for r in baseline}
+    failures = []
+    for r in results:
+        key = (r["resolution"], r["holes"])
+        for name in ("part_error_cm", "holes_error_cm", "height_error_cm"):
+            if max_error_cm is not None and r[name] > max_error_cm:
+                failures.append(f"{key}: {name} {r[name]:.3f} > {max_error_cm}")
+            if key in previous and r[name] > previous[key][name] + error_slack_cm:
+                failures.append(f"{key}: {name} {r[name]:.3f} > {previous[key][name]:.3f} + {error_slack_cm}")
+        if key in previous:
+            if r["holes_missed"] > previous[key]["holes_missed"]:
+                failures.append(f"{key}: holes_missed {r['holes_missed']} > {previous[key]['holes_missed']}")
+            for name in ("process_top_frame_ms", "classify_contours_ms", "calculate_object_height_ms"):
+                limit = max(previous[key][name][0] * (1 + slack), previous[key][name][0] + min_slack_ms)
+                if r[name][0] > limit:
+                    failures.append(f"{key}: {name} {r[name][0]:.2f} ms > {limit:.2f} ms")
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark speed and accuracy of the measurement functions on synthetic scenes.")
+    parser.add_argument("--repeat", type=int, default=30, help="timed calls per function and scene")
+    parser.add_argument("--resolutions", nargs="+", default=[f"{w}x{h}" for w, h in RESOLUTIONS])
+    parser.add_argument("--holes", nargs="+", type=int, default=HOLE_COUNTS, help="holes per top scene")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--slack", type=float, default=0.25, help="allowed latency increase over the baseline")
+    parser.add_argument("--min-slack-ms", type=float, default=0.5, help="latency increase always tolerated, against timer noise")
+    parser.add_argument("--error-slack-cm", type=float, default=0.02, help="allowed error increase over the baseline")
+    parser.add_argument("--max-error-cm", type=float, help="absolute limit on every measurement error (default: none)")
+    parser.add_argument("--pyramid", type=int, default=0, metavar="LEVELS",
+                        help="benchmark coarse-to-fine measurement from a frame halved LEVELS times")
+    args = parser.parse_args(argv)
+
+    resolutions = [tuple(int(v) for v in r.split("x")) for r in args.resolutions]
+    results = run(resolutions, args.holes, args.repeat, args.pyramid)
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = regressions(results, json.load(f), args.slack, args.max_error_cm, args.min_slack_ms,
+                                   args.error_slack_cm)
+        for failure in failures:
+            print("REGRESSION", failure)
+        if failures:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
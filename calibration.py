@@ -0,0 +1,157 @@
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from capture import open_captures
+from lens import get_undistorter
+from measurement import threshold_top, find_side_reference_pixels
+
+# Per-camera calibration profile.
+#
+# The profile is a JSON file holding, for the top camera, the pixel-to-cm
+# ratio and ROI of the 10 cm black reference box, and for the side camera
+# the pixel length of the AB reference bar and the height offset added to
+# every measurement. The hot path uses these values as they are; DriftMonitor
+# re-checks the references every few hundred frames and reports when they no
+# longer match the profile.
+#
+# With lens files (lens.py) the references are detected on lens-corrected
+# frames, and each camera's entry names its lens file so that measurement
+# corrects the same way.
+
+DEFAULT_PROFILE_PATH = "calibration.json"
+BOX_SIZE_CM = 10.0
+AB_cm = 9
+
+def detect_top_reference(frame):
+    thresh = threshold_top(frame)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    return {"pixel_to_cm_ratio": max(w, h) / BOX_SIZE_CM, "reference_roi": [x, y, w, h]}
+
+def detect_side_reference(frame, ab_cm=AB_cm):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    ab_pixels = int(find_side_reference_pixels(gray))
+    if ab_pixels == 0:
+        return None
+    return {"ab_cm": ab_cm, "ab_pixels": ab_pixels}
+
+# lenses is an optional (top, side) pair of lens file paths
+def calibrate(top_frame, side_frame, ab_cm=AB_cm, lenses=(None, None)):
+    top_lens, side_lens = lenses
+    if top_lens:
+        top_frame = get_undistorter(top_lens).frame(top_frame)
+    if side_lens:
+        side_frame = get_undistorter(side_lens).frame(side_frame)
+    top = detect_top_reference(top_frame)
+    side = detect_side_reference(side_frame, ab_cm)
+    if top is None or side is None:
+        raise ValueError("reference not found in " + ("top" if top is None else "side") + " frame")
+    # Same offset capture_all derives from the box position on every frame
+    side["offset_cm"] = top["reference_roi"][1] / top["pixel_to_cm_ratio"]
+    top["frame_size"] = list(top_frame.shape[1::-1])
+    side["frame_size"] = list(side_frame.shape[1::-1])
+    if top_lens:
+        top["lens"] = top_lens
+    if side_lens:
+        side["lens"] = side_lens
+    return {
+        "calibration_id": time.strftime("%Y%m%d-%H%M%S"),
+        "top": top,
+        "side": side,
+    }
+
+def save_profile(profile, path=DEFAULT_PROFILE_PATH):
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+
+def load_profile(path=DEFAULT_PROFILE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+def pad_roi(roi, padding, frame_shape):
+    x, y, w, h = roi
+    x0, y0 = max(0, x - padding), max(0, y - padding)
+    x1, y1 = min(frame_shape[1], x + w + padding), min(frame_shape[0], y + h + padding)
+    return x0, y0, x1 - x0, y1 - y0
+
+# Periodic re-check of the calibration references
+class DriftMonitor:
+    def __init__(self, profile, interval=300, tolerance=0.02, padding=20):
+        self.profile = profile
+        self.interval = interval
+        self.tolerance = tolerance
+        self.padding = padding
+        self.frame_count = 0
+        self.drift = {}
+
+    def check_top(self, frame):
+        top = self.profile["top"]
+        x, y, w, h = pad_roi(top["reference_roi"], self.padding, frame.shape)
+        if top.get("lens"):
+            reference = detect_top_reference(get_undistorter(top["lens"]).roi(frame, (x, y, w, h)))
+        else:
+            reference = detect_top_reference(frame[y:y+h, x:x+w])
+        if reference is None:
+            return float("inf")
+        return abs(reference["pixel_to_cm_ratio"] / top["pixel_to_cm_ratio"] - 1)
+
+    def check_side(self, frame):
+        side = self.profile["side"]
+        if side.get("lens"):
+            frame = get_undistorter(side["lens"]).frame(frame)
+        reference = detect_side_reference(frame, side["ab_cm"])
+        if reference is None:
+            return float("inf")
+        return abs(reference["ab_pixels"] / side["ab_pixels"] - 1)
+
+    # Call once per measured pair; returns {camera: relative error} for the
+    # cameras found out of tolerance at the last check, empty when in spec
+    def update(self, top_frame, side_frame):
+        self.frame_count += 1
+        if self.frame_count % self.interval == 0:
+            errors = {"top": self.check_top(top_frame), "side": self.check_side(side_frame)}
+            self.drift = {camera: error for camera, error in errors.items() if error > self.tolerance}
+        return self.drift
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the top and side cameras and write a profile.")
+    parser.add_argument("--top", type=int, default=0, help="top camera index")
+    parser.add_argument("--side", type=int, default=2, help="side camera index")
+    parser.add_argument("--ab-cm", type=float, default=AB_cm, help="length of the side-view reference bar in cm")
+    parser.add_argument("--frames", type=int, default=15, help="frames to average over")
+    parser.add_argument("--top-lens", help="lens file of the top camera (lens.py)")
+    parser.add_argument("--side-lens", help="lens file of the side camera (lens.py)")
+    parser.add_argument("--output", "-o", default=DEFAULT_PROFILE_PATH)
+    args = parser.parse_args(argv)
+
+    # Same camera settings (cameras.json) as measurement, since the scale
+    # depends on the resolution
+    cap_top, cap_side = open_captures(args.top, args.side)
+    profiles = []
+    for _ in range(args.frames):
+        ret_top, top_frame = cap_top.read()
+        ret_side, side_frame = cap_side.read()
+        if ret_top and ret_side:
+            try:
+                profiles.append(calibrate(top_frame, side_frame, args.ab_cm, (args.top_lens, args.side_lens)))
+            except ValueError:
+                pass
+    cap_top.release()
+    cap_side.release()
+    if not profiles:
+        raise SystemExit("Calibration failed: reference not found")
+
+    # Keep the frame whose scale is the median, to reject flicker
+    ratios = [p["top"]["pixel_to_cm_ratio"] for p in profiles]
+    profile = profiles[int(np.argsort(ratios)[len(ratios) // 2])]
+    save_profile(profile, args.output)
+    print(f"Saved calibration {profile['calibration_id']} to {args.output}")
+
+if __name__ == "__main__":
+    main()
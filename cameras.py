@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Camera settings and a latency probe.
+#
+# cameras.json holds the capture settings of each camera role:
+#     {"top":  {"fourcc": "MJPG", "width": 1280, "height": 720, "fps": 30, "buffer_size": 1, "exposure": -6},
+#      "side": {"fourcc": "MJPG", "width": 1280, "height": 720, "fps": 30, "buffer_size": 1}}
+#
+# Every key is optional; missing keys keep the driver default. "fourcc" is
+# set first because it decides which sizes and rates the driver offers:
+# MJPG lets two cameras share one USB bus at 720p/30 where raw YUYV does
+# not. "buffer_size" is the number of frames the driver queues (1 keeps
+# read() from returning frames several periods old), "exposure" switches to
+# manual exposure with that driver value ("auto" or no key keeps
+# auto-exposure) and "backend" picks the OpenCV capture API ("v4l2",
+# "dshow", "msmf"). capture.open_captures applies the file when it exists.
+#
+#     python cameras.py --top 0 --side 2                 # probe both cameras at once
+#     python cameras.py --top 0 --side 2 --no-config     # same, with driver defaults
+#
+# The probe reads each camera as fast as it delivers and reports the
+# settings the driver actually accepted, the real frame rate and interval
+# jitter, the decode time and, where the driver stamps its buffers with the
+# monotonic clock (V4L2), the frame age: how long ago the frame was exposed
+# when the application had it decoded. After a pause it also counts how many
+# queued frames come back without waiting for the sensor, i.e. how stale the
+# first frame after a slow measurement is.
+
+DEFAULT_CONFIG_PATH = "cameras.json"
+MAX_FRAME_AGE = 5.0  # seconds; larger driver timestamps are not monotonic-clock stamps
+# CAP_PROP_AUTO_EXPOSURE value that selects manual exposure, per backend
+MANUAL_EXPOSURE = {"V4L2": 1, "DSHOW": 0.25}
+AUTO_EXPOSURE = {"V4L2": 3, "DSHOW": 0.75}
+
+def load_camera_config(path=DEFAULT_CONFIG_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+camera_config = None
+
+# Read on first use; empty when there is no cameras.json
+def get_camera_config():
+    global camera_config
+    if camera_config is None:
+        camera_config = load_camera_config(DEFAULT_CONFIG_PATH) if os.path.exists(DEFAULT_CONFIG_PATH) else {}
+    return camera_config
+
+def fourcc_code(name):
+    return cv2.VideoWriter_fourcc(*name)
+
+def fourcc_name(code):
+    code = int(code)
+    return "".join(chr((code >> 8 * i) & 0xFF) for i in range(4)) if code > 0 else None
+
+# Applies settings to an open capture and returns what the driver reports
+# back, which may differ from what was asked for
+def configure_camera(cap, settings):
+    if settings.get("fourcc"):
+        cap.set(cv2.CAP_PROP_FOURCC, fourcc_code(settings["fourcc"]))
+    if settings.get("width"):
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, settings["width"])
+    if settings.get("height"):
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, settings["height"])
+    if settings.get("fps"):
+        cap.set(cv2.CAP_PROP_FPS, settings["fps"])
+    if settings.get("buffer_size"):
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, settings["buffer_size"])
+    exposure = settings.get("exposure")
+    if exposure is not None:
+        backend = cap.getBackendName() if hasattr(cap, "getBackendName") else ""
+        if exposure == "auto":
+            cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, AUTO_EXPOSURE.get(backend, 0.75))
+        else:
+            cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, MANUAL_EXPOSURE.get(backend, 0.25))
+            cap.set(cv2.CAP_PROP_EXPOSURE, exposure)
+    return camera_settings(cap)
+
+def camera_settings(cap):
+    return {"fourcc": fourcc_name(cap.get(cv2.CAP_PROP_FOURCC)),
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": cap.get(cv2.CAP_PROP_FPS),
+            "buffer_size": int(cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+            "exposure": cap.get(cv2.CAP_PROP_EXPOSURE)}
+
+# Requested settings the driver did not take, as {key: [requested, actual]}
+def mismatches(settings, actual):
+    different = {}
+    for key in ("fourcc", "width", "height", "fps", "buffer_size"):
+        value = settings.get(key)
+        if value and actual[key] != value:
+            different[key] = [value, actual[key]]
+    return different
+
+def open_camera(source, settings=None):
+    settings = settings or {}
+    backend = settings.get("backend")
+    cap = cv2.VideoCapture(source, getattr(cv2, f"CAP_{backend.upper()}")) if backend else cv2.VideoCapture(source)
+    if settings and cap.isOpened():
+        configure_camera(cap, settings)
+    return cap
+
+# Monotonic time at which the frame just grabbed was captured, from the
+# driver's buffer timestamp, or None when the driver does not provide one
+# on the monotonic clock
+def driver_timestamp(cap, now):
+    msec = cap.get(cv2.CAP_PROP_POS_MSEC)
+    if msec > 0 and 0.0 <= now - msec / 1000.0 < MAX_FRAME_AGE:
+        return msec / 1000.0
+    return None
+
+def percentiles(values, scale=1000.0):
+    if not values:
+        return None
+    p50, p95 = np.percentile(values, (50, 95))
+    return {"p50": float(p50) * scale, "p95": float(p95) * scale, "max": max(values) * scale}
+
+def probe(cap, duration=5.0, pause=0.5, warmup=10):
+    for _ in range(warmup):
+        cap.grab()
+    grabs, ages, decodes, failures = [], [], [], 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        if not cap.grab():
+            failures += 1
+            time.sleep(0.005)
+            continue
+        grabbed = time.monotonic()
+        exposed = driver_timestamp(cap, grabbed)
+        ret, _ = cap.retrieve()
+        decoded = time.monotonic()
+        if not ret:
+            failures += 1
+            continue
+        grabs.append(grabbed)
+        decodes.append(decoded - grabbed)
+        if exposed is not None:
+            ages.append(decoded - exposed)
+    intervals = np.diff(grabs).tolist()
+    fps = (len(grabs) - 1) / (grabs[-1] - grabs[0]) if len(grabs) > 1 else 0.0
+    result = {"frames": len(grabs), "failures": failures, "fps": fps,
+              "interval_ms": percentiles(intervals), "decode_ms": percentiles(decodes),
+              "age_ms": percentiles(ages)}
+
+    # Frames queued while the application was busy come back at once; the
+    # first grab that waits for the sensor ends the queue. A grab that
+    # happens to land just before the next sensor frame can be counted too,
+    # hence the tight threshold.
+    if fps:
+        time.sleep(pause)
+        queued, first_age = 0, None
+        while queued < 32:
+            start = time.monotonic()
+            if not cap.grab():
+                break
+            now = time.monotonic()
+            if queued == 0:
+                exposed = driver_timestamp(cap, now)
+                first_age = None if exposed is None else (now - exposed) * 1000.0
+            if now - start > 0.1 / fps:
+                break
+            queued += 1
+        result["queued_after_pause"] = queued
+        result["age_after_pause_ms"] = first_age
+    return result
+
+# Probes all cameras at the same time, since they share the USB bandwidth
+def probe_cameras(caps, duration=5.0, pause=0.5):
+    results = {}
+    def run(name, cap):
+        results[name] = probe(cap, duration, pause)
+    threads = [threading.Thread(target=run, args=item) for item in caps.items()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply the camera settings and measure frame rate and frame age.")
+    parser.add_argument("--top", type=int, help="top camera index")
+    parser.add_argument("--side", type=int, help="side camera index")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, help="camera settings file")
+    parser.add_argument("--no-config", action="store_true", help="probe with the driver defaults")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to capture")
+    parser.add_argument("--pause", type=float, default=0.5, help="pause before counting queued frames")
+    args = parser.parse_args(argv)
+    sources = {name: source for name, source in (("top", args.top), ("side", args.side)) if source is not None}
+    if not sources:
+        parser.error("give --top and/or --side")
+
+    config = {} if args.no_config or not os.path.exists(args.config) else load_camera_config(args.config)
+    caps = {name: open_camera(source, config.get(name)) for name, source in sources.items()}
+    try:
+        for name, cap in caps.items():
+            if not cap.isOpened():
+                raise SystemExit(f"Cannot open the {name} camera ({sources[name]})")
+        results = probe_cameras(caps, args.duration, args.pause)
+        for name, cap in caps.items():
+            actual = camera_settings(cap)
+            result = {"camera": name, "source": sources[name], "settings": actual,
+                      "not_applied": mismatches(config.get(name, {}), actual), **results[name]}
+            sys.stdout.write(json.dumps(result) + "\n")
+    finally:
+        for cap in caps.values():
+            cap.release()
+
+if __name__ == "__main__":
+    main()
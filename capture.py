@@ -0,0 +1,191 @@
+import collections
+import os
+import threading
+import time
+
+import cv2
+
+from cameras import driver_timestamp, get_camera_config, open_camera
+from instrumentation import metrics
+
+# Timestamp-synchronized dual-camera capture.
+#
+# Each camera is drained by its own thread with grab()/retrieve(): grab()
+# latches the sensor frame and is stamped with time.monotonic() right away,
+# so the slower decode in retrieve() neither skews the timestamp nor blocks
+# the other camera. Drivers that stamp their buffers on the monotonic clock
+# (V4L2) give the exposure time instead, so pair skew and the latency of a
+# result are measured from the glass rather than from the grab. The last
+# few frames of each camera are kept in a ring buffer and SyncedCapture
+# hands out the newest top/side pair whose timestamps are within max_skew
+# seconds of each other.
+#
+# With a FramePool (see framepool.py) each camera decodes into preallocated
+# buffers; pairs then carry references to their buffers, which the consumer
+# hands back with pair.release() once it no longer needs the frames.
+
+class FramePair(collections.namedtuple("FramePair", ["top", "side", "top_time", "side_time", "buffers"],
+                                       defaults=((),))):
+    __slots__ = ()
+
+    # Returns pooled frames to their pool; a no-op for unpooled pairs
+    def release(self):
+        for buffer in self.buffers:
+            buffer.release()
+
+class CameraStream:
+    # source is a camera index/URL or an already configured capture object;
+    # name prefixes the instrumentation stages ("capture.<name>.decode");
+    # pool is an optional FramePool to decode into
+    def __init__(self, source, buffer_size=4, condition=None, name="camera", pool=None):
+        self.name = name
+        self.pool = pool
+        self.cap = source if hasattr(source, "grab") else cv2.VideoCapture(source)
+        self.frames = collections.deque()
+        self.buffer_size = buffer_size
+        self.condition = condition or threading.Condition()
+        self.sequence = 0
+        self.consumed_sequence = 0
+        self.dropped = 0
+        self.listeners = []
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        decode_stage = f"capture.{self.name}.decode"
+        dropped_counter = f"capture.{self.name}.dropped"
+        overwritten_counter = f"capture.{self.name}.overwritten"
+        pool_counter = f"capture.{self.name}.unpooled"
+        while self.running:
+            if not self.cap.grab():
+                self.dropped += 1
+                metrics.count(dropped_counter)
+                time.sleep(0.005)
+                continue
+            # Replayed recordings report their recorded capture time
+            if hasattr(self.cap, "timestamp"):
+                timestamp = self.cap.timestamp()
+            else:
+                now = time.monotonic()
+                timestamp = driver_timestamp(self.cap, now) or now
+            buffer = self.pool.acquire() if self.pool is not None and self.pool.allocated else None
+            with metrics.stage(decode_stage):
+                ret, frame = self.cap.retrieve() if buffer is None else self.cap.retrieve(buffer.array)
+            if buffer is not None and not (ret and frame is buffer.array):
+                # Decoded elsewhere (frame size changed) or not at all
+                buffer.release()
+                buffer = None
+            if not ret:
+                self.dropped += 1
+                metrics.count(dropped_counter)
+                continue
+            if buffer is None and self.pool is not None:
+                metrics.count(pool_counter)
+                if not self.pool.allocated:
+                    self.pool.allocate(frame.shape, frame.dtype)
+            with self.condition:
+                self.sequence += 1
+                if len(self.frames) == self.buffer_size:
+                    _, old_sequence, _, old_buffer = self.frames.popleft()
+                    if old_sequence > self.consumed_sequence:
+                        metrics.count(overwritten_counter)
+                    if old_buffer is not None:
+                        old_buffer.release()
+                self.frames.append((timestamp, self.sequence, frame, buffer))
+                self.condition.notify_all()
+            for listener in self.listeners:
+                listener(timestamp, frame)
+
+    # (timestamp, sequence, frame, buffer) tuples, oldest first; buffer is
+    # None for unpooled frames
+    def snapshot(self):
+        with self.condition:
+            return list(self.frames)
+
+    def latest(self):
+        with self.condition:
+            return self.frames[-1] if self.frames else None
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.cap.release()
+        with self.condition:
+            for _, _, _, buffer in self.frames:
+                if buffer is not None:
+                    buffer.release()
+            self.frames.clear()
+
+# Opens a camera index, a video file or URL, or one camera of a recording
+# directory made by recording.py; clock keeps replayed cameras in step.
+# settings (see cameras.py) only apply to cameras.
+def open_capture(source, name, realtime=True, clock=None, settings=None):
+    if isinstance(source, str) and os.path.isdir(source):
+        from recording import ReplayCapture
+        return ReplayCapture(source, name, realtime=realtime, clock=clock)
+    return open_camera(source, settings if isinstance(source, int) else None)
+
+# Top and side captures; a recording directory replaces both cameras. config
+# maps "top"/"side" to camera settings and defaults to cameras.json.
+def open_captures(top_source=0, side_source=2, recording=None, realtime=True, config=None):
+    if recording is None:
+        config = get_camera_config() if config is None else config
+        return (open_capture(top_source, "top", settings=config.get("top")),
+                open_capture(side_source, "side", settings=config.get("side")))
+    from recording import ReplayClock
+    clock = ReplayClock()
+    return (open_capture(recording, "top", realtime, clock),
+            open_capture(recording, "side", realtime, clock))
+
+class SyncedCapture:
+    # pools is an optional (top, side) pair of FramePools
+    def __init__(self, top_source, side_source, max_skew=0.010, buffer_size=4, pools=(None, None)):
+        self.condition = threading.Condition()
+        self.top = CameraStream(top_source, buffer_size, self.condition, "top", pools[0])
+        self.side = CameraStream(side_source, buffer_size, self.condition, "side", pools[1])
+        self.max_skew = max_skew
+        self.last_top_sequence = 0
+        self.last_side_sequence = 0
+
+    def start(self):
+        self.top.start()
+        self.side.start()
+        return self
+
+    # Newest unseen pair within max_skew, or None if there is none yet
+    def _match(self):
+        side_frames = self.side.snapshot()
+        if not side_frames:
+            return None
+        for top_time, top_sequence, top_frame, top_buffer in reversed(self.top.snapshot()):
+            if top_sequence <= self.last_top_sequence:
+                break
+            side_time, side_sequence, side_frame, side_buffer = min(side_frames, key=lambda f: abs(f[0] - top_time))
+            if side_sequence > self.last_side_sequence and abs(side_time - top_time) <= self.max_skew:
+                self.last_top_sequence = self.top.consumed_sequence = top_sequence
+                self.last_side_sequence = self.side.consumed_sequence = side_sequence
+                buffers = tuple(buffer.retain() for buffer in (top_buffer, side_buffer) if buffer is not None)
+                return FramePair(top_frame, side_frame, top_time, side_time, buffers)
+        return None
+
+    # Blocks until a matching pair arrives; returns None after timeout seconds
+    def read(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                pair = self._match()
+                remaining = deadline - time.monotonic()
+                if pair is not None or remaining <= 0:
+                    return pair
+                self.condition.wait(remaining)
+
+    def stop(self):
+        self.top.stop()
+        self.side.stop()
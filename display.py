@@ -0,0 +1,74 @@
+import time
+
+import cv2
+import numpy as np
+
+# Low-overhead rendering of frames into Tk labels.
+#
+# Each panel owns a preallocated RGB buffer and a single PhotoImage. Frames
+# are resized with OpenCV first and colour-converted afterwards, on the small
+# image, straight into that buffer, which is then pasted into the existing
+# PhotoImage instead of allocating a new one. The buffer is RGBA because
+# that is the pixel layout PIL can wrap without copying. A panel whose
+# source has not changed since the last render is skipped. Overlay contours
+# are drawn into the panel's own small buffer, never into the (possibly
+# pooled) source frame.
+# PIL is imported by the first panel, so FrameRateLimiter works without it.
+
+PANEL_SIZE = (300, 300)
+
+class Panel:
+    def __init__(self, label, size=PANEL_SIZE):
+        from PIL import Image, ImageTk
+        self.photo_image = ImageTk.PhotoImage
+        self.label = label
+        self.size = size
+        width, height = size
+        self.resized = np.empty((height, width, 3), dtype=np.uint8)
+        self.resized_gray = np.empty((height, width), dtype=np.uint8)
+        self.rgba = np.empty((height, width, 4), dtype=np.uint8)
+        self.image = Image.frombuffer("RGBA", size, self.rgba, "raw", "RGBA", 0, 1)
+        self.photo = None
+        self.source_frame = None
+        self.source_key = None
+
+    # key identifies the content (e.g. a frame timestamp); by default the
+    # frame object itself. contours, in frame coordinates, are drawn on top.
+    # Returns False when the panel was left untouched.
+    def show(self, frame, key=None, contours=None):
+        if key is None:
+            unchanged = frame is self.source_frame
+        else:
+            unchanged = self.source_key is not None and key == self.source_key
+        self.source_frame, self.source_key = frame, key
+        if unchanged:
+            return False
+        if frame.ndim == 2:
+            cv2.resize(frame, self.size, dst=self.resized_gray, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(self.resized_gray, cv2.COLOR_GRAY2RGBA, dst=self.rgba)
+        else:
+            cv2.resize(frame, self.size, dst=self.resized, interpolation=cv2.INTER_AREA)
+            if contours:
+                scale = (self.size[0] / frame.shape[1], self.size[1] / frame.shape[0])
+                scaled = [(contour * scale).astype(np.int32) for contour in contours]
+                cv2.drawContours(self.resized, scaled, -1, (0, 255, 0), 2)
+            cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        if self.photo is None:
+            self.photo = self.photo_image(self.image)
+            self.label.config(image=self.photo)
+        else:
+            self.photo.paste(self.image)
+        return True
+
+# Caps how often the panels are redrawn, independently of measurement
+class FrameRateLimiter:
+    def __init__(self, max_fps):
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.last = 0.0
+
+    def due(self):
+        now = time.monotonic()
+        if now - self.last < self.interval:
+            return False
+        self.last = now
+        return True
@@ -0,0 +1,103 @@
+import collections
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Preallocated, reference-counted frame buffers.
+#
+# A FramePool owns one contiguous block holding `count` frames of a fixed
+# shape. Cameras decode straight into a free buffer (cap.retrieve(buffer))
+# instead of allocating a new array per frame, and every holder of a frame
+# (the capture ring buffer, a queued pair, a worker, the display) keeps a
+# reference: the buffer returns to the pool when the last one is released.
+# When all buffers are in use acquire() returns None and the caller falls
+# back to an ordinary allocation, so a stalled consumer costs memory churn
+# rather than lost frames.
+#
+# A pool created with shared=True lives in multiprocessing.shared_memory.
+# Worker processes then receive a small descriptor (buffer.ref()) instead of
+# a pickled frame and map the same memory with shared_frame(). Code reading
+# pooled frames must not draw into them; overlays go to separate buffers.
+
+class FrameBuffer:
+    __slots__ = ("pool", "index", "array", "refs")
+
+    def __init__(self, pool, index, array):
+        self.pool = pool
+        self.index = index
+        self.array = array
+        self.refs = 0
+
+    def retain(self):
+        with self.pool.lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with self.pool.lock:
+            self.refs -= 1
+            if self.refs == 0:
+                self.pool.free.append(self.index)
+
+    # Picklable descriptor for shared_frame() in another process
+    def ref(self):
+        return self.pool.shm.name, self.array.shape, self.array.dtype.str, self.index
+
+class FramePool:
+    def __init__(self, count=8, shared=False):
+        self.count = count
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.shm = None
+        self.buffers = []
+        self.free = collections.deque()
+        self.exhausted = 0
+
+    @property
+    def allocated(self):
+        return bool(self.buffers)
+
+    # Pools are sized from the first frame a camera delivers
+    def allocate(self, shape, dtype=np.uint8):
+        dtype = np.dtype(dtype)
+        shape = (self.count, *shape)
+        if self.shared:
+            self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+            block = np.ndarray(shape, dtype, buffer=self.shm.buf)
+        else:
+            block = np.empty(shape, dtype)
+        with self.lock:
+            self.buffers = [FrameBuffer(self, i, block[i]) for i in range(self.count)]
+            self.free = collections.deque(range(self.count))
+
+    # A buffer holding one reference, or None when every buffer is in use
+    def acquire(self):
+        with self.lock:
+            if not self.free:
+                self.exhausted += 1
+                return None
+            buffer = self.buffers[self.free.popleft()]
+            buffer.refs = 1
+            return buffer
+
+    def close(self):
+        self.buffers = []
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+# Shared blocks attached by this (worker) process, by name. Workers started
+# by multiprocessing share the creator's resource tracker, so attaching does
+# not make them responsible for unlinking the block.
+attached = {}
+
+def shared_frame(ref):
+    name, shape, dtype, index = ref
+    shm = attached.get(name)
+    if shm is None:
+        shm = attached[name] = shared_memory.SharedMemory(name=name)
+    dtype = np.dtype(dtype)
+    offset = index * int(np.prod(shape)) * dtype.itemsize
+    return np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
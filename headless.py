@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import AB_cm, init_worker, safe_measure_pair
+from calibration import load_profile
+from cameras import load_camera_config
+from capture import SyncedCapture, open_captures
+from framepool import FramePool, shared_frame
+from inspection import inspect_record, load_catalogue
+from motion import GATE_SETTLED, MotionGate
+from resultstore import ResultStore
+from segmentation import get_default_segmenter
+from tracking import RoiTracker
+
+# Headless measurement service for line controllers without a display.
+#
+# Runs the capture -> process_top_frame -> calculate_object_height loop and
+# writes one JSON line per measured pair to stdout or to every client of a
+# local Unix socket. Only OpenCV and NumPy are loaded (no tkinter or PIL).
+# Capture runs on its own threads, so when a measurement takes longer than a
+# frame interval the next measurement simply uses the newest pair.
+#
+# With --processes the cameras decode into shared-memory frame pools and
+# pairs are measured in a process pool: workers receive buffer descriptors
+# and map the frames, nothing is pickled but the descriptors and results.
+#
+# With --database every result is also appended to the measurement log
+# (resultstore.py) from a background writer thread. With --catalogue every
+# result names the matching part and whether it passed (inspection.py).
+
+REPLAY_END_TIMEOUT = 2.0  # seconds without a pair before a replay counts as finished
+
+class SocketBroadcaster:
+    # Clients that cannot take a line within send_timeout seconds are dropped
+    # so that one stalled reader never slows down the measurement loop
+    def __init__(self, path, send_timeout=0.05):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.path = path
+        self.send_timeout = send_timeout
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.clients = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            client.settimeout(self.send_timeout)
+            with self.lock:
+                self.clients.append(client)
+
+    def write(self, line):
+        data = line.encode()
+        with self.lock:
+            for client in list(self.clients):
+                try:
+                    client.sendall(data)
+                except OSError:
+                    client.close()
+                    self.clients.remove(client)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            for client in self.clients:
+                client.close()
+            self.clients = []
+        os.unlink(self.path)
+
+# live=False is for replayed recordings: they end, and their timestamps are
+# recorded ones, so no latency can be computed
+# gate, a MotionGate, limits measuring to pairs where a new part has settled
+# levels > 0 measures coarse-to-fine on that pyramid level (pyramid.py)
+# store, a ResultStore, also logs every result
+# catalogue, an inspection.Catalogue, adds the part ID and pass/fail
+def run(synced_capture, out, ab_cm=AB_cm, profile=None, track=False, count=None, live=True, gate=None, levels=0,
+        store=None, catalogue=None):
+    trackers = (RoiTracker(), RoiTracker()) if track else None
+    measured = 0
+    last_pair = time.monotonic()
+    while count is None or measured < count:
+        pair = synced_capture.read(timeout=1.0)
+        if pair is None:
+            if not live and time.monotonic() - last_pair > REPLAY_END_TIMEOUT:
+                break
+            continue
+        last_pair = time.monotonic()
+        if gate is not None and gate.update(pair.top) != GATE_SETTLED:
+            continue
+        record = safe_measure_pair(pair.top, pair.side, ab_cm, profile, trackers, levels)
+        record["time"] = time.time()
+        if catalogue is not None:
+            inspect_record(record, catalogue)
+        if live:
+            record["latency_ms"] = (time.monotonic() - pair.top_time) * 1000.0
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        if store is not None:
+            store.add(record)
+        measured += 1
+    return measured
+
+def measure_shared_pair(job):
+    top_ref, side_ref, ab_cm, profile, levels = job
+    return safe_measure_pair(shared_frame(top_ref), shared_frame(side_ref), ab_cm, profile, levels=levels)
+
+# Like run(), with up to 2 pairs per worker process in flight; results are
+# written in capture order
+def run_processes(synced_capture, out, workers, ab_cm=AB_cm, profile=None, count=None, live=True, gate=None, levels=0,
+                  store=None, catalogue=None):
+    in_flight = deque()
+    measured = 0
+    last_pair = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        while count is None or measured + len(in_flight) < count:
+            pair = synced_capture.read(timeout=1.0)
+            if pair is None:
+                if not live and time.monotonic() - last_pair > REPLAY_END_TIMEOUT:
+                    break
+                continue
+            last_pair = time.monotonic()
+            if gate is not None and gate.update(pair.top) != GATE_SETTLED:
+                pair.release()
+                continue
+            if len(pair.buffers) != 2:
+                pair.release()  # Pools exhausted or not allocated yet
+                continue
+            job = (pair.buffers[0].ref(), pair.buffers[1].ref(), ab_cm, profile, levels)
+            in_flight.append((pair, pool.submit(measure_shared_pair, job)))
+            while in_flight and (len(in_flight) >= 2 * workers or in_flight[0][1].done()):
+                measured += write_result(out, *in_flight.popleft(), live, store, catalogue)
+        while in_flight:
+            measured += write_result(out, *in_flight.popleft(), live, store, catalogue)
+    return measured
+
+def write_result(out, pair, future, live, store=None, catalogue=None):
+    record = future.result()
+    pair.release()
+    record["time"] = time.time()
+    if catalogue is not None:
+        inspect_record(record, catalogue)
+    if live:
+        record["latency_ms"] = (time.monotonic() - pair.top_time) * 1000.0
+    out.write(json.dumps(record) + "\n")
+    out.flush()
+    if store is not None:
+        store.add(record)
+    return 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure continuously without a GUI and stream JSON lines.")
+    parser.add_argument("--top", type=int, default=0, help="top camera index")
+    parser.add_argument("--side", type=int, default=2, help="side camera index")
+    parser.add_argument("--recording", metavar="DIR", help="replay a recording made by recording.py instead of the cameras")
+    parser.add_argument("--cameras", metavar="PATH", help="camera settings file (default: cameras.json if present)")
+    parser.add_argument("--socket", metavar="PATH", help="serve results on this Unix socket instead of stdout")
+    parser.add_argument("--profile", help="calibration profile to use instead of per-frame reference detection")
+    parser.add_argument("--ab-cm", type=float, default=AB_cm, help="length of the side-view reference bar in cm")
+    parser.add_argument("--max-skew", type=float, default=0.010, help="largest top/side time difference in seconds")
+    parser.add_argument("--track", action="store_true", help="process only a window around the last box/object position")
+    parser.add_argument("--count", type=int, help="stop after this many measurements")
+    parser.add_argument("--gate", action="store_true",
+                        help="measure once per newly placed part, after it has been still for --settle-frames")
+    parser.add_argument("--settle-frames", type=int, default=5, help="still frames before a gated measurement")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="measure in this many worker processes fed through shared memory (no --track)")
+    parser.add_argument("--pyramid", type=int, default=0, metavar="LEVELS",
+                        help="detect on a frame halved LEVELS times and refine edges at full resolution")
+    parser.add_argument("--database", metavar="PATH", help="also log every result to this SQLite measurement log")
+    parser.add_argument("--station", help="station name for the measurement log")
+    parser.add_argument("--catalogue", metavar="PATH", help="inspect every result against this part catalogue")
+    args = parser.parse_args(argv)
+    if args.pyramid and args.track:
+        parser.error("--pyramid and --track cannot be combined")
+    if args.processes and args.track:
+        parser.error("--processes and --track cannot be combined")
+
+    profile = load_profile(args.profile) if args.profile else None
+    camera_config = load_camera_config(args.cameras) if args.cameras else None
+    cap_top, cap_side = open_captures(args.top, args.side, args.recording, config=camera_config)
+    # Ring buffer, pairs in flight and one frame being decoded
+    pools = ((FramePool(4 + 2 * args.processes + 2, shared=True), FramePool(4 + 2 * args.processes + 2, shared=True))
+             if args.processes else (None, None))
+    synced_capture = SyncedCapture(cap_top, cap_side, max_skew=args.max_skew, pools=pools).start()
+    out = SocketBroadcaster(args.socket) if args.socket else sys.stdout
+    gate = MotionGate(settle_frames=args.settle_frames) if args.gate else None
+    store = ResultStore(args.database, args.station).start() if args.database else None
+    catalogue = load_catalogue(args.catalogue) if args.catalogue else None
+    if not args.processes:
+        # Colour tables (segmentation.py) are built before the first frame
+        get_default_segmenter()
+    try:
+        if args.processes:
+            measured = run_processes(synced_capture, out, args.processes, args.ab_cm, profile, args.count,
+                                     live=not args.recording, gate=gate, levels=args.pyramid, store=store,
+                                     catalogue=catalogue)
+        else:
+            measured = run(synced_capture, out, args.ab_cm, profile, args.track, args.count,
+                           live=not args.recording, gate=gate, levels=args.pyramid, store=store,
+                           catalogue=catalogue)
+    except KeyboardInterrupt:
+        measured = None
+    finally:
+        synced_capture.stop()
+        for pool in pools:
+            if pool is not None:
+                pool.close()
+        if out is not sys.stdout:
+            out.close()
+        if store is not None:
+            store.close()
+    if measured is not None:
+        print(f"Measured {measured} pairs", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
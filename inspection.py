@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# Pass/fail inspection against a catalogue of part templates.
+#
+# parts.json:
+#     {"tolerance_cm": 0.1, "height_tolerance_cm": 0.2,
+#      "parts": [{"id": "BR-1001", "shape": "Rectangle", "dimensions": [7.1, 6.1], "height_cm": 5.3,
+#                 "shapes_within": [{"shape": "Circle", "dimensions": 0.85},
+#                                   {"shape": "Rectangle", "dimensions": [0.85, 0.5]}]},
+#                {"id": "DK-2040", "shape": "Circle", "dimensions": 6.0, "height_cm": 1.2, "shapes_within": [],
+#                 "tolerance_cm": 0.05}]}
+#
+# Tolerances are per part, falling back to the catalogue's. Every part is
+# reduced to a short feature vector: its outer dimensions (longest side
+# first, so a part turned by 90 degrees matches), height, the number of
+# rectangles and circles within and the sum of their dimensions, plus the
+# outer shape. Shape and counts are weighted so that a different shape or
+# a missing hole moves a part further away than any dimension error. The
+# vectors go into a single KD-tree (cv2.flann_Index) when the catalogue is
+# loaded; a measurement looks up its nearest CANDIDATES parts and only those
+# are compared dimension by dimension. The result names the matching part,
+# or the nearest part and what is out of tolerance.
+#
+#     python batch.py --images captures/ | python inspection.py --catalogue parts.json
+
+DEFAULT_CATALOGUE_PATH = "parts.json"
+DEFAULT_TOLERANCE_CM = 0.1
+DEFAULT_HEIGHT_TOLERANCE_CM = 0.2
+CANDIDATES = 8
+COUNT_WEIGHT = 10.0  # feature distance of one extra or missing shape within
+SHAPE_WEIGHT = 100.0  # feature distance between a rectangle and a circle
+FLANN_INDEX_KDTREE_SINGLE = 4
+
+# (long, short) for a rectangle, (diameter, diameter) for a circle
+def extent(shape, dimensions):
+    if shape == "Rectangle":
+        return tuple(sorted((float(d) for d in dimensions), reverse=True))
+    return float(dimensions), float(dimensions)
+
+# shapes_within as in batch records, a list of {"shape", "dimensions"};
+# returns the sorted rectangle extents and circle diameters
+def split_within(shapes_within):
+    rectangles = sorted(extent("Rectangle", s["dimensions"]) for s in shapes_within if s["shape"] == "Rectangle")
+    circles = sorted(float(s["dimensions"]) for s in shapes_within if s["shape"] == "Circle")
+    return rectangles, circles
+
+def feature(shape, dimensions, height_cm, shapes_within):
+    rectangles, circles = split_within(shapes_within)
+    long_side, short_side = extent(shape, dimensions)
+    return [long_side, short_side, height_cm,
+            COUNT_WEIGHT * len(rectangles), COUNT_WEIGHT * len(circles),
+            sum(r[0] for r in rectangles), sum(r[1] for r in rectangles), sum(circles),
+            SHAPE_WEIGHT * (shape == "Circle")]
+
+# Out-of-tolerance findings of a measurement against one part, and the
+# largest deviation in cm
+def compare(part, shape, dimensions, height_cm, shapes_within):
+    tolerance, height_tolerance = part["tolerance_cm"], part["height_tolerance_cm"]
+    failures, worst = [], 0.0
+    if shape != part["shape"]:
+        failures.append(f"shape {shape}, expected {part['shape']}")
+    else:
+        names = ("length", "width") if shape == "Rectangle" else ("diameter",)
+        for name, measured, expected in zip(names, extent(shape, dimensions), part["extent"]):
+            worst = max(worst, abs(measured - expected))
+            if abs(measured - expected) > tolerance:
+                failures.append(f"{name} {measured:.2f} cm, expected {expected:.2f} +/- {tolerance:.2f}")
+    worst = max(worst, abs(height_cm - part["height_cm"]))
+    if abs(height_cm - part["height_cm"]) > height_tolerance:
+        failures.append(f"height {height_cm:.2f} cm, expected {part['height_cm']:.2f} +/- {height_tolerance:.2f}")
+    rectangles, circles = split_within(shapes_within)
+    for name, measured, expected in (("rectangles", rectangles, part["rectangles"]),
+                                     ("circles", circles, part["circles"])):
+        if len(measured) != len(expected):
+            failures.append(f"{len(measured)} {name} within, expected {len(expected)}")
+            continue
+        # Both lists are sorted, so equal-sized features pair up in order
+        if name == "rectangles":
+            measured, expected = [d for r in measured for d in r], [d for r in expected for d in r]
+        deviation = max((abs(m - e) for m, e in zip(measured, expected)), default=0.0)
+        worst = max(worst, deviation)
+        if deviation > tolerance:
+            failures.append(f"{name} within off by {deviation:.2f} cm (+/- {tolerance:.2f})")
+    return failures, worst
+
+class Catalogue:
+    def __init__(self, parts, tolerance_cm=DEFAULT_TOLERANCE_CM, height_tolerance_cm=DEFAULT_HEIGHT_TOLERANCE_CM):
+        if not parts:
+            raise ValueError("the catalogue has no parts")
+        self.parts = []
+        for part in parts:
+            rectangles, circles = split_within(part.get("shapes_within", []))
+            self.parts.append({"id": part["id"], "shape": part["shape"], "height_cm": float(part["height_cm"]),
+                               "extent": extent(part["shape"], part["dimensions"]),
+                               "rectangles": rectangles, "circles": circles,
+                               "tolerance_cm": part.get("tolerance_cm", tolerance_cm),
+                               "height_tolerance_cm": part.get("height_tolerance_cm", height_tolerance_cm)})
+        self.features = np.array([feature(p["shape"], p["dimensions"], p["height_cm"], p.get("shapes_within", []))
+                                  for p in parts], dtype=np.float32)
+        self.index = cv2.flann_Index(self.features, dict(algorithm=FLANN_INDEX_KDTREE_SINGLE))
+        self.candidates = min(CANDIDATES, len(self.parts))
+
+    # Inspection results for a list of records (see batch.pair_record), with
+    # one index lookup for all of them
+    def inspect_many(self, records):
+        results, measured = [], []
+        for i, record in enumerate(records):
+            if record.get("shape") and record.get("height_cm") is not None:
+                results.append(None)
+                measured.append(i)
+            else:
+                results.append({"part_id": None, "pass": False,
+                                "failures": [record.get("error") or "no part measured"]})
+        if not measured:
+            return results
+        queries = np.array([feature(records[i]["shape"], records[i]["dimensions"], records[i]["height_cm"],
+                                    records[i]["shapes_within"]) for i in measured], dtype=np.float32)
+        neighbours, _ = self.index.knnSearch(queries, self.candidates, params={})
+        for i, candidates in zip(measured, neighbours):
+            record = records[i]
+            best = None
+            # Candidates come nearest first; the first one is kept on ties
+            for j in candidates:
+                failures, worst = compare(self.parts[j], record["shape"], record["dimensions"],
+                                          record["height_cm"], record["shapes_within"])
+                key = (len(failures) > 0, worst if not failures else 0.0)
+                if best is None or key < best[0]:
+                    best = key, j, failures, worst
+            _, j, failures, worst = best
+            results[i] = {"part_id": self.parts[j]["id"], "pass": not failures, "failures": failures,
+                          "max_deviation_cm": worst}
+        return results
+
+    def inspect(self, record):
+        return self.inspect_many([record])[0]
+
+def load_catalogue(path=DEFAULT_CATALOGUE_PATH):
+    with open(path) as f:
+        config = json.load(f)
+    return Catalogue(config["parts"], config.get("tolerance_cm", DEFAULT_TOLERANCE_CM),
+                     config.get("height_tolerance_cm", DEFAULT_HEIGHT_TOLERANCE_CM))
+
+default_catalogue = None
+
+# Loaded on first use; None when there is no parts.json
+def get_default_catalogue():
+    global default_catalogue
+    if default_catalogue is None and os.path.exists(DEFAULT_CATALOGUE_PATH):
+        default_catalogue = load_catalogue(DEFAULT_CATALOGUE_PATH)
+    return default_catalogue
+
+# Adds the inspection result to a measurement record in place
+def inspect_record(record, catalogue):
+    record.update(catalogue.inspect(record))
+    return record
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect JSON-lines measurements against a part catalogue.")
+    parser.add_argument("input", nargs="?", help="measurements from batch.py or headless.py (default: stdin)")
+    parser.add_argument("--catalogue", default=DEFAULT_CATALOGUE_PATH, help="part catalogue")
+    parser.add_argument("--output", "-o", help="JSON-lines output file (default: stdout)")
+    parser.add_argument("--batch", type=int, default=1024, help="records per index lookup")
+    args = parser.parse_args(argv)
+
+    catalogue = load_catalogue(args.catalogue)
+    source = open(args.input) if args.input else sys.stdin
+    out = open(args.output, "w") if args.output else sys.stdout
+    passed = total = 0
+    def flush(records):
+        for record, result in zip(records, catalogue.inspect_many(records)):
+            record.update(result)
+            out.write(json.dumps(record) + "\n")
+        return sum(record["pass"] for record in records)
+    try:
+        records = []
+        for line in source:
+            if line.strip():
+                records.append(json.loads(line))
+            if len(records) == args.batch:
+                passed += flush(records)
+                total += len(records)
+                records = []
+        passed += flush(records)
+        total += len(records)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    print(f"Inspected {total} parts, {passed} passed", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
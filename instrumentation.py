@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+
+# Hot-path instrumentation: per-stage latency histograms and event counters.
+#
+# Code marks stages with `with metrics.stage("top.contours"):` and counts
+# events such as dropped frames with metrics.count("capture.top.dropped").
+# While disabled, stage() hands back one shared no-op context manager and
+# count() returns immediately, so the instrumentation can stay in the hot
+# path. Snapshots can be rendered as a text overlay, dumped as JSON or
+# written in the Prometheus textfile-collector format.
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, float("inf"))
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_STAGE = NullStage()
+
+class Stage:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.maximum = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.count += 1
+        self.maximum = max(self.maximum, seconds)
+
+    # Quantile q, interpolated linearly inside its bucket
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(BUCKETS, self.counts):
+            if count and seen + count >= rank:
+                upper = min(bound, self.maximum)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.maximum
+
+class Instrumentation:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.monotonic()
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.started = time.monotonic()
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            stages = {
+                name: {
+                    "count": h.count,
+                    "sum_s": h.total,
+                    "rate_hz": h.count / elapsed if elapsed else 0.0,
+                    "mean_ms": 1000 * h.total / h.count if h.count else 0.0,
+                    "p50_ms": 1000 * h.quantile(0.5),
+                    "p95_ms": 1000 * h.quantile(0.95),
+                    "max_ms": 1000 * h.maximum,
+                    "buckets": dict(zip([str(b) for b in BUCKETS], h.counts)),
+                }
+                for name, h in self.histograms.items()
+            }
+            return {"elapsed_s": elapsed, "stages": stages, "counters": dict(self.counters)}
+
+    def overlay_text(self):
+        snapshot = self.snapshot()
+        lines = [f"{name:<22} {s['p50_ms']:7.2f} {s['p95_ms']:7.2f} ms {s['rate_hz']:6.1f}/s"
+                 for name, s in sorted(snapshot["stages"].items())]
+        lines += [f"{name:<22} {value}" for name, value in sorted(snapshot["counters"].items())]
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.snapshot(), indent=2))
+
+    # Prometheus textfile-collector format (node_exporter --collector.textfile)
+    # Formatted from one locked snapshot, so stages added or observed by
+    # other threads meanwhile cannot tear the output
+    def write_prometheus(self, path, prefix="component_verification"):
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+        for name, stage in sorted(snapshot["stages"].items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stage["buckets"].values()):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stage["sum_s"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f'{prefix}_events_total{{event="{name}"}} {value}')
+        write_atomic(path, "\n".join(lines) + "\n")
+
+# Readers (and the textfile collector) must never see a half-written file
+def write_atomic(path, text):
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        f.write(text)
+    os.replace(temporary, path)
+
+# Process-wide instance used by the shared modules; scripts switch it on with
+# metrics.enabled = True
+metrics = Instrumentation()
@@ -0,0 +1,252 @@
+import argparse
+import functools
+import glob
+import hashlib
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from cameras import get_camera_config, open_camera
+from measurement import calculate_object_height, process_top_frame
+from segmentation import get_default_segmenter
+
+# Lens distortion correction from a checkerboard calibration.
+#
+# `python lens.py --camera 0 -o lens_top.json` collects views of a printed
+# checkerboard from one camera, computes its intrinsics (camera matrix and
+# distortion coefficients) with cv2.calibrateCamera and writes them to a
+# JSON file.
+# An Undistorter builds the cv2.initUndistortRectifyMap tables for them once
+# and caches them in a .npz file next to the JSON, so later runs just load
+# them. The tables hold, for every pixel of the corrected image, where to
+# read it in the camera frame; slicing them to a rectangle and calling
+# cv2.remap therefore corrects only that rectangle. The hot path corrects
+# only the ROI it measures, a fraction of the cost of cv2.undistort (or a
+# full remap) per frame.
+#
+# A calibration profile made with lens files (calibration.py --top-lens /
+# --side-lens) stores its references in corrected coordinates and names the
+# lens file of each camera, and measurement with that profile corrects the
+# reference ROI (top) and the object's bounding box (side) on every frame.
+
+DEFAULT_LENS_PATHS = ("lens_top.json", "lens_side.json")
+LENS_SUFFIX = ".npz"
+DEFAULT_BOARD = (9, 6)  # inner corners per row and column
+DEFAULT_SQUARE_MM = 25.0
+MIN_VIEWS = 10
+ROI_PADDING = 8  # corrected pixels around a located object
+SUBPIX_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+# Refined inner corners of the checkerboard in a grey image, or None
+def find_board(gray, board=DEFAULT_BOARD):
+    found, corners = cv2.findChessboardCorners(
+        gray, board, flags=cv2.CALIB_CB_ADAPTIVE_THRESH | cv2.CALIB_CB_NORMALIZE_IMAGE | cv2.CALIB_CB_FAST_CHECK)
+    if not found:
+        return None
+    return cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1), SUBPIX_CRITERIA)
+
+def board_points(board=DEFAULT_BOARD, square_mm=DEFAULT_SQUARE_MM):
+    points = np.zeros((board[0] * board[1], 3), np.float32)
+    points[:, :2] = np.mgrid[0:board[0], 0:board[1]].T.reshape(-1, 2) * square_mm
+    return points
+
+# Intrinsics from a list of corner sets found in images of image_size
+# (width, height). alpha=0 crops the corrected image to valid pixels only.
+def calibrate_lens(corner_sets, image_size, board=DEFAULT_BOARD, square_mm=DEFAULT_SQUARE_MM, alpha=0.0):
+    if len(corner_sets) < MIN_VIEWS:
+        raise ValueError(f"{len(corner_sets)} checkerboard views, at least {MIN_VIEWS} needed")
+    object_points = [board_points(board, square_mm)] * len(corner_sets)
+    rms, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(object_points, corner_sets, image_size, None, None)
+    new_camera_matrix, _ = cv2.getOptimalNewCameraMatrix(camera_matrix, dist_coeffs, image_size, alpha, image_size)
+    # The crop can scale the axes differently; corrected pixels have to be
+    # square for one pixel_to_cm_ratio to hold in both directions
+    new_camera_matrix[0, 0] = new_camera_matrix[1, 1] = max(new_camera_matrix[0, 0], new_camera_matrix[1, 1])
+    return {
+        "lens_id": time.strftime("%Y%m%d-%H%M%S"),
+        "image_size": list(image_size),
+        "camera_matrix": camera_matrix.tolist(),
+        "dist_coeffs": dist_coeffs.ravel().tolist(),
+        "new_camera_matrix": new_camera_matrix.tolist(),
+        "rms_px": float(rms),
+        "views": len(corner_sets),
+    }
+
+def save_lens(lens, path):
+    with open(path, "w") as f:
+        json.dump(lens, f, indent=2)
+
+def load_lens(path):
+    with open(path) as f:
+        return json.load(f)
+
+class Undistorter:
+    def __init__(self, lens, cache_path=None):
+        self.lens = lens
+        self.camera_matrix = np.array(lens["camera_matrix"])
+        self.dist_coeffs = np.array(lens["dist_coeffs"])
+        self.new_camera_matrix = np.array(lens["new_camera_matrix"])
+        self.width, self.height = lens["image_size"]
+        self.map1, self.map2 = self.load_maps(cache_path)
+
+    # The cache is only used when it was built from exactly these intrinsics
+    def load_maps(self, cache_path):
+        key = hashlib.sha1(json.dumps([self.lens["camera_matrix"], self.lens["dist_coeffs"],
+                                       self.lens["new_camera_matrix"], self.lens["image_size"]]).encode()).hexdigest()
+        if cache_path and os.path.exists(cache_path):
+            with np.load(cache_path) as cache:
+                if str(cache["key"]) == key:
+                    return cache["map1"], cache["map2"]
+        # Fixed-point maps: half the memory of float maps and a faster remap
+        map1, map2 = cv2.initUndistortRectifyMap(self.camera_matrix, self.dist_coeffs, None, self.new_camera_matrix,
+                                                 (self.width, self.height), cv2.CV_16SC2)
+        if cache_path:
+            np.savez(cache_path, key=key, map1=map1, map2=map2)
+        return map1, map2
+
+    def check(self, frame):
+        if frame.shape[1] != self.width or frame.shape[0] != self.height:
+            raise ValueError(f"frame is {frame.shape[1]}x{frame.shape[0]}, lens calibrated for {self.width}x{self.height}")
+
+    def frame(self, frame):
+        self.check(frame)
+        return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR)
+
+    # The corrected image inside roi (x, y, w, h, in corrected coordinates)
+    def roi(self, frame, roi):
+        self.check(frame)
+        x, y, w, h = (int(v) for v in roi)
+        return cv2.remap(frame, self.map1[y:y+h, x:x+w], self.map2[y:y+h, x:x+w], cv2.INTER_LINEAR)
+
+    # Corrected bounding box of a box given in camera pixels. Straight edges
+    # are curved by the lens, so points along all four edges are mapped.
+    def box(self, box, padding=0):
+        x, y, w, h = box
+        t = np.linspace(0, 1, 9)
+        edges = np.concatenate([
+            np.stack([x + t * w, np.full_like(t, y)], 1), np.stack([x + t * w, np.full_like(t, y + h)], 1),
+            np.stack([np.full_like(t, x), y + t * h], 1), np.stack([np.full_like(t, x + w), y + t * h], 1)])
+        points = cv2.undistortPoints(edges.reshape(-1, 1, 2), self.camera_matrix, self.dist_coeffs,
+                                     P=self.new_camera_matrix).reshape(-1, 2)
+        x0, y0 = np.floor(points.min(0)) - padding
+        x1, y1 = np.ceil(points.max(0)) + padding
+        x0, y0 = max(0, int(x0)), max(0, int(y0))
+        x1, y1 = min(self.width, int(x1)), min(self.height, int(y1))
+        return x0, y0, x1 - x0, y1 - y0
+
+undistorters = {}
+
+# Undistorter for a lens file, built (or loaded from its map cache) once per
+# process
+def get_undistorter(path):
+    undistorter = undistorters.get(path)
+    if undistorter is None:
+        undistorter = undistorters[path] = Undistorter(load_lens(path), os.path.splitext(path)[0] + LENS_SUFFIX)
+    return undistorter
+
+# process_top_frame (or `measure`, a function with its signature) with a
+# calibration profile whose reference ROI is in corrected coordinates: only
+# that ROI is corrected and measured
+def process_top_frame_undistorted(frame, calibration, undistorter, draw=True, measure=process_top_frame):
+    x, y, w, h = (int(v) for v in calibration["reference_roi"])
+    roi = undistorter.roi(frame, (x, y, w, h))
+    result = measure(roi, dict(calibration, reference_roi=[0, 0, w, h]), draw=draw)
+    return result[:6] + (x, y, w, h)
+
+# calculate_object_height (or `measure`) with ab_pixels from a profile in
+# corrected coordinates. The object is located on a quarter-size camera
+# frame and only its padded, corrected bounding box is measured; the mask
+# returned is that of the box.
+def calculate_object_height_undistorted(image, AB_cm, additional_distance_cm, ab_pixels, undistorter, segmenter=None,
+                                        measure=calculate_object_height):
+    if segmenter is None:
+        segmenter = get_default_segmenter()
+    undistorter.check(image)
+    small = cv2.resize(image, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_NEAREST)
+    x, y, w, h = cv2.boundingRect(segmenter.mask(small))
+    if w == 0 or h == 0:
+        return additional_distance_cm, np.zeros((0, 0), np.uint8)
+    roi = undistorter.box((x * 4, y * 4, w * 4, h * 4), ROI_PADDING + 4)
+    return measure(undistorter.roi(image, roi), AB_cm, additional_distance_cm, ab_pixels, segmenter=segmenter)
+
+# (top, side) measurement functions for a calibration profile: top_fn and
+# side_fn themselves, or their lens-corrected versions for cameras whose
+# profile entry names a lens file
+def profile_measurements(profile, top_fn=process_top_frame, side_fn=calculate_object_height):
+    if profile["top"].get("lens"):
+        top_fn = functools.partial(process_top_frame_undistorted, undistorter=get_undistorter(profile["top"]["lens"]),
+                                   measure=top_fn)
+    if profile["side"].get("lens"):
+        side_fn = functools.partial(calculate_object_height_undistorted,
+                                    undistorter=get_undistorter(profile["side"]["lens"]), measure=side_fn)
+    return top_fn, side_fn
+
+def image_corner_sets(paths, board):
+    corner_sets, image_size = [], None
+    for path in paths:
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        corners = find_board(image, board)
+        if corners is not None:
+            corner_sets.append(corners)
+            image_size = image.shape[::-1]
+    return corner_sets, image_size
+
+# Collects a view whenever the board is found, at most one per interval
+# seconds, so the operator can move the board between views. settings are
+# the camera's entry of cameras.json, so the lens is calibrated at the
+# resolution it measures at.
+def camera_corner_sets(source, board, views, interval, settings=None):
+    cap = open_camera(source, settings)
+    corner_sets, image_size, last = [], None, 0.0
+    try:
+        while len(corner_sets) < views:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if time.monotonic() - last < interval:
+                continue
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            corners = find_board(gray, board)
+            if corners is not None:
+                corner_sets.append(corners)
+                image_size = gray.shape[::-1]
+                last = time.monotonic()
+                print(f"View {len(corner_sets)}/{views}")
+    finally:
+        cap.release()
+    return corner_sets, image_size
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Checkerboard lens calibration for one camera.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--camera", type=int, help="camera index to capture checkerboard views from")
+    source.add_argument("--images", metavar="GLOB", help="checkerboard images, e.g. 'board/*.png'")
+    parser.add_argument("--board", default=f"{DEFAULT_BOARD[0]}x{DEFAULT_BOARD[1]}", help="inner corners, e.g. 9x6")
+    parser.add_argument("--square-mm", type=float, default=DEFAULT_SQUARE_MM, help="checkerboard square size")
+    parser.add_argument("--views", type=int, default=20, help="camera mode: views to collect")
+    parser.add_argument("--interval", type=float, default=1.0, help="camera mode: seconds between views")
+    parser.add_argument("--role", choices=("top", "side"), help="camera mode: apply this camera's cameras.json settings")
+    parser.add_argument("--output", "-o", required=True, help="lens file to write, e.g. lens_top.json")
+    args = parser.parse_args(argv)
+
+    board = tuple(int(v) for v in args.board.split("x"))
+    if args.images:
+        corner_sets, image_size = image_corner_sets(sorted(glob.glob(args.images)), board)
+    else:
+        settings = get_camera_config().get(args.role) if args.role else None
+        corner_sets, image_size = camera_corner_sets(args.camera, board, args.views, args.interval, settings)
+    try:
+        lens = calibrate_lens(corner_sets, image_size, board, args.square_mm)
+    except ValueError as exc:
+        raise SystemExit(f"Lens calibration failed: {exc}")
+    save_lens(lens, args.output)
+    # Build the map cache now rather than on the first measurement
+    get_undistorter(args.output)
+    print(f"Saved lens {lens['lens_id']} to {args.output} (reprojection error {lens['rms_px']:.3f} px)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import cv2
+import numpy as np
+
+from instrumentation import metrics
+from segmentation import get_default_segmenter
+
+# Measurement functions shared by the GUI scripts and the batch/headless tools.
+# This module must stay free of import-time side effects (no cameras, no Tk)
+# so that worker processes can import it cheaply.
+
+def classify_and_measure(contour, pixel_to_cm_ratio, area=None, perimeter=None):
+    # area and perimeter may be passed in when the caller already has them
+    if perimeter is None:
+        perimeter = cv2.arcLength(contour, True)
+    approx = cv2.approxPolyDP(contour, 0.04 * perimeter, True)
+    if len(approx) == 4:
+        x, y, w, h = cv2.boundingRect(approx)
+        width_cm = w / pixel_to_cm_ratio
+        height_cm = h / pixel_to_cm_ratio
+        return "Rectangle", (width_cm, height_cm)
+    else:
+        if area is None:
+            area = cv2.contourArea(contour)
+        if area > 0:
+            circularity = (4 * np.pi * area) / (perimeter * perimeter)
+            if circularity > 0.75:
+                (x, y), radius = cv2.minEnclosingCircle(contour)
+                diameter_cm = (2 * radius) / pixel_to_cm_ratio
+                return "Circle", diameter_cm
+    return None, None
+
+# Area, perimeter, bounding box and centroid of every contour, computed once
+# per frame for all contours together. The contours are polygons, so area
+# and centroid follow from the shoelace formula over the concatenated
+# vertices, summed per contour with np.add.reduceat; the results match
+# cv2.contourArea, cv2.arcLength and cv2.boundingRect.
+def contour_stats(contours):
+    count = len(contours)
+    if count == 0:
+        return np.empty(0), np.empty(0), np.empty((0, 4), dtype=np.int32), np.empty((0, 2))
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    lengths = np.fromiter((len(c) for c in contours), dtype=np.intp, count=count)
+    starts = np.zeros(count, dtype=np.intp)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    x, y = points[:, 0], points[:, 1]
+    next_x, next_y = x[following], y[following]
+    cross = x * next_y - next_x * y
+    signed_areas = 0.5 * np.add.reduceat(cross, starts)
+    areas = np.abs(signed_areas)
+    perimeters = np.add.reduceat(np.hypot(next_x - x, next_y - y), starts)
+    min_x, min_y = np.minimum.reduceat(x, starts), np.minimum.reduceat(y, starts)
+    max_x, max_y = np.maximum.reduceat(x, starts), np.maximum.reduceat(y, starts)
+    boxes = np.stack([min_x, min_y, max_x - min_x + 1, max_y - min_y + 1], axis=1).astype(np.int32)
+    # Degenerate (zero-area) contours get the centre of their bounding box
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cx = np.add.reduceat((x + next_x) * cross, starts) / (6 * signed_areas)
+        cy = np.add.reduceat((y + next_y) * cross, starts) / (6 * signed_areas)
+    degenerate = signed_areas == 0
+    cx[degenerate] = (min_x + max_x)[degenerate] / 2
+    cy[degenerate] = (min_y + max_y)[degenerate] / 2
+    return areas, perimeters, boxes, np.stack([cx, cy], axis=1)
+
+# Batched shape classification. One record per classified contour:
+# index into contours, shape code, polygon vertex count, size in cm
+# (width/height for rectangles, diameter for circles), centroid in pixels
+# and a confidence in [0, 1] (fill of the bounding box for rectangles,
+# circularity for circles). Contours below min_area are dropped up front,
+# unclassified ones (SHAPE_NONE) at the end unless keep_unclassified is set.
+SHAPE_NONE, SHAPE_RECTANGLE, SHAPE_CIRCLE = 0, 1, 2
+SHAPE_NAMES = (None, "Rectangle", "Circle")
+SHAPE_DTYPE = np.dtype([
+    ("index", np.int32),
+    ("shape", np.uint8),
+    ("vertices", np.int32),
+    ("width_cm", np.float32),
+    ("height_cm", np.float32),
+    ("diameter_cm", np.float32),
+    ("cx", np.float32),
+    ("cy", np.float32),
+    ("confidence", np.float32),
+])
+# Below this many contours a plain loop is faster than the NumPy calls that
+# batch the classification, whose fixed cost only pays off on busy frames
+BATCH_MIN_CONTOURS = 64
+
+def classify_contours(contours, pixel_to_cm_ratio, stats=None, indices=None, min_area=0, keep_unclassified=False):
+    areas, perimeters, boxes, centroids = stats if stats is not None else contour_stats(contours)
+    if indices is None:
+        indices = np.arange(len(areas))
+    indices = np.asarray(indices, dtype=np.intp)
+    indices = indices[areas[indices] >= min_area]
+    if len(indices) < BATCH_MIN_CONTOURS:
+        return classify_per_contour(contours, pixel_to_cm_ratio, areas[indices].tolist(),
+                                    perimeters[indices].tolist(), centroids[indices].tolist(), indices.tolist(),
+                                    keep_unclassified)
+    area = areas[indices]
+    perimeter = perimeters[indices]
+    # Douglas-Peucker has no batched form in OpenCV, so it runs per contour;
+    # everything else is computed for all contours at once
+    epsilons = (0.04 * perimeter).tolist()
+    approximations = [cv2.approxPolyDP(contours[i], epsilon, True) for i, epsilon in zip(indices.tolist(), epsilons)]
+    vertices = np.fromiter(map(len, approximations), dtype=np.int32, count=len(indices))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        circularity = np.where(perimeter > 0, (4 * np.pi * area) / (perimeter * perimeter), 0)
+    rectangles = vertices == 4
+    circles = ~rectangles & (area > 0) & (circularity > 0.75)
+
+    records = np.zeros(len(indices), dtype=SHAPE_DTYPE)
+    records["index"] = indices
+    records["vertices"] = vertices
+    records["cx"] = centroids[indices, 0]
+    records["cy"] = centroids[indices, 1]
+    records["shape"][rectangles] = SHAPE_RECTANGLE
+    records["shape"][circles] = SHAPE_CIRCLE
+    # Rectangles are sized by the box of their approximated polygon, as in
+    # classify_and_measure, not by the box of the raw contour. Their four
+    # corners stack into one array, so the boxes come from one min/max.
+    if rectangles.any():
+        corners = np.concatenate([approximations[k] for k in np.flatnonzero(rectangles).tolist()]).reshape(-1, 4, 2)
+        w, h = (corners.max(axis=1) - corners.min(axis=1) + 1).T
+        records["width_cm"][rectangles] = w / pixel_to_cm_ratio
+        records["height_cm"][rectangles] = h / pixel_to_cm_ratio
+        records["confidence"][rectangles] = area[rectangles] / (w * h)
+    if circles.any():
+        records["diameter_cm"][circles] = [2 * cv2.minEnclosingCircle(contours[i])[1] / pixel_to_cm_ratio
+                                           for i in indices[circles].tolist()]
+        records["confidence"][circles] = np.minimum(circularity[circles], 1)
+    if keep_unclassified:
+        return records
+    return records[records["shape"] != SHAPE_NONE]
+
+# classify_contours for a few contours: the same records, built in a loop.
+# areas, perimeters and centroids are lists parallel to indices.
+def classify_per_contour(contours, pixel_to_cm_ratio, areas, perimeters, centroids, indices, keep_unclassified=False):
+    rows = []
+    for i, area, perimeter, (cx, cy) in zip(indices, areas, perimeters, centroids):
+        approx = cv2.approxPolyDP(contours[i], 0.04 * perimeter, True)
+        if len(approx) == 4:
+            _, _, w, h = cv2.boundingRect(approx)
+            rows.append((i, SHAPE_RECTANGLE, 4, w / pixel_to_cm_ratio, h / pixel_to_cm_ratio, 0, cx, cy,
+                         area / (w * h)))
+            continue
+        circularity = (4 * np.pi * area) / (perimeter * perimeter) if perimeter > 0 else 0
+        if area > 0 and circularity > 0.75:
+            radius = cv2.minEnclosingCircle(contours[i])[1]
+            rows.append((i, SHAPE_CIRCLE, len(approx), 0, 0, 2 * radius / pixel_to_cm_ratio, cx, cy,
+                         min(circularity, 1)))
+        elif keep_unclassified:
+            rows.append((i, SHAPE_NONE, len(approx), 0, 0, 0, cx, cy, 0))
+    return np.array(rows, dtype=SHAPE_DTYPE)
+
+# (shape, dimensions) tuple in the form classify_and_measure returns
+def shape_tuple(record):
+    if record["shape"] == SHAPE_RECTANGLE:
+        return "Rectangle", (float(record["width_cm"]), float(record["height_cm"]))
+    return "Circle", float(record["diameter_cm"])
+
+# Indices of the contours lying inside the contour at box_index.
+# RETR_CCOMP gives a two-level tree: the holes of the box are its children,
+# while parts sitting in those holes are outer contours of their own. A
+# contour is inside the box when the outer contour of its component is.
+def contours_inside(hierarchy, boxes, box_index):
+    parents = hierarchy[:, 3]
+    components = np.where(parents == -1, np.arange(len(parents)), parents)
+    x, y, w, h = boxes[box_index]
+    bx, by, bw, bh = boxes.T
+    within = (bx >= x) & (by >= y) & (bx + bw <= x + w) & (by + bh <= y + h)
+    inside = within[components]
+    inside[box_index] = False
+    return np.flatnonzero(inside)
+
+# Accepts BGR or already grey images
+def threshold_top(image):
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, thresh = cv2.threshold(blurred, 50, 255, cv2.THRESH_BINARY_INV)
+    return thresh
+
+# Detection half of process_top_frame, also run on a reduced pyramid level
+# by pyramid.py. Returns (thresh, contours, stats, box, pixel_to_cm_ratio,
+# records, largest_index): thresh covers the reference ROI when calibrated
+# and the whole frame otherwise, contours and stats are in thresh
+# coordinates, box (x, y, w, h) is in frame coordinates, records are the
+# classified contours inside the box and largest_index is the contour index
+# of the largest of them (None when the box is empty).
+def detect_top(frame, calibration=None, keep_unclassified=False):
+    with metrics.stage("top.threshold"):
+        if calibration is None:
+            thresh = threshold_top(frame)
+        else:
+            x, y, w, h = calibration["reference_roi"]
+            thresh = threshold_top(frame[y:y+h, x:x+w])
+    with metrics.stage("top.contours"):
+        contours, hierarchy = cv2.findContours(thresh, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        stats = contour_stats(contours)
+    areas, perimeters, boxes, centroids = stats
+    box_index = int(np.argmax(areas))
+    if calibration is None:
+        box = tuple(int(v) for v in boxes[box_index])
+        pixel_to_cm_ratio = max(box[2], box[3]) / 10.0
+    else:
+        box = tuple(int(v) for v in calibration["reference_roi"])
+        pixel_to_cm_ratio = calibration["pixel_to_cm_ratio"]
+    records = np.zeros(0, dtype=SHAPE_DTYPE)
+    largest_index = None
+    valid_indices = contours_inside(hierarchy[0], boxes, box_index)
+    valid_indices = valid_indices[areas[valid_indices] < areas[box_index]]
+    if len(valid_indices):
+        largest_index = int(valid_indices[np.argmax(areas[valid_indices])])
+        with metrics.stage("top.classify"):
+            records = classify_contours(contours, pixel_to_cm_ratio, stats, valid_indices,
+                                        keep_unclassified=keep_unclassified)
+    return thresh, contours, stats, box, pixel_to_cm_ratio, records, largest_index
+
+# (largest_shape, largest_dimensions, shapes_within) from detect_top records
+def split_records(records, largest_index):
+    shapes_within = []
+    largest_shape, largest_dimensions = None, None
+    for record in records:
+        if record["index"] == largest_index:
+            largest_shape, largest_dimensions = shape_tuple(record)
+        elif record["shape"] == SHAPE_CIRCLE or (record["width_cm"] and record["height_cm"]):
+            shapes_within.append(shape_tuple(record))
+    return largest_shape, largest_dimensions, shapes_within
+
+# With a calibration profile (the "top" entry of calibration.load_profile)
+# the scale and box position are taken as stored, so only the reference ROI
+# is thresholded and contoured instead of the whole frame. The input frame is
+# never modified: the returned cropped frame is a view of it, or with
+# draw=True a copy with the largest inner contour drawn.
+def process_top_frame(frame, calibration=None, draw=True):
+    thresh, contours, stats, box, pixel_to_cm_ratio, records, largest_index = detect_top(frame, calibration)
+    x, y, w, h = box
+    cropped_frame = frame[y:y+h, x:x+w]
+    if calibration is None:
+        cropped_thresh = thresh[y:y+h, x:x+w]
+        offset = (-x, -y)
+    else:
+        cropped_thresh = thresh
+        offset = (0, 0)
+    if draw and largest_index is not None:
+        cropped_frame = cropped_frame.copy()
+        cv2.drawContours(cropped_frame, contours, largest_index, (0, 255, 0), 2, offset=offset)
+    largest_shape, largest_dimensions, shapes_within = split_records(records, largest_index)
+    return cropped_frame, cropped_thresh, largest_shape, largest_dimensions, shapes_within, pixel_to_cm_ratio, x, y, w, h
+
+def calculate_object_distance_from_box_bottom(cropped_thresh, pixel_to_cm_ratio, box_bottom_y):
+    non_black_pixels = cropped_thresh > 0
+    vertical_lines = np.sum(non_black_pixels, axis=1)
+    object_distance_pixels = np.argmax(vertical_lines)
+    object_distance_cm = object_distance_pixels / pixel_to_cm_ratio
+    distance_from_box_bottom_cm = box_bottom_y / pixel_to_cm_ratio
+    return distance_from_box_bottom_cm
+
+# ab_pixels may come from a calibration profile, which saves the full-frame
+# threshold and reference line search on every frame. The object mask comes
+# from a colour lookup table (segmentation.py); segmenter defaults to the one
+# configured in segmentation.json.
+def calculate_object_height(image, AB_cm, additional_distance_cm, ab_pixels=None, segmenter=None):
+    if ab_pixels is None:
+        with metrics.stage("side.reference"):
+            ab_pixels = find_side_reference_pixels(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+    if not ab_pixels:
+        raise ValueError("side reference bar not found")
+    if segmenter is None:
+        segmenter = get_default_segmenter()
+    with metrics.stage("side.segment"):
+        mask = segmenter.mask(image)
+    with metrics.stage("side.runs"):
+        obj_height_pixels = find_longest_contiguous_non_black_line(mask)
+    pixel_to_cm_ratio = AB_cm / ab_pixels
+    height_cm = (obj_height_pixels * pixel_to_cm_ratio) + additional_distance_cm
+    return height_cm, mask
+
+# Length in pixels of the dark AB reference bar in the side view. Dark pixels
+# are the zero ("black") pixels of a plain binary threshold.
+def find_side_reference_pixels(gray_image):
+    _, binary_image = cv2.threshold(gray_image, 50, 255, cv2.THRESH_BINARY)
+    return find_longest_contiguous_black_line(binary_image)
+
+# Run-length profile of a mask: for every column, the length of its longest
+# contiguous vertical run of set pixels and the row where that run starts
+# (-1 for empty columns). Fully vectorized: a run starts where a pixel is set
+# and the one above is not, and ends where the one below is not. Both edge
+# maps are scanned in row-major order, so a stable sort by column pairs the
+# k-th start of each column with its k-th end.
+def vertical_run_profile(mask):
+    mask = np.asarray(mask) > 0
+    rows, cols = mask.shape
+    starts = np.empty_like(mask)
+    ends = np.empty_like(mask)
+    starts[0] = mask[0]
+    np.greater(mask[1:], mask[:-1], out=starts[1:])
+    ends[-1] = mask[-1]
+    np.greater(mask[:-1], mask[1:], out=ends[:-1])
+    start_rows, start_cols = np.divmod(np.flatnonzero(starts), cols)
+    end_rows, end_cols = np.divmod(np.flatnonzero(ends), cols)
+    start_order = np.argsort(start_cols, kind="stable")
+    end_order = np.argsort(end_cols, kind="stable")
+    run_cols = start_cols[start_order]
+    run_starts = start_rows[start_order]
+    run_lengths = end_rows[end_order] + 1 - run_starts
+    lengths = np.zeros(cols, dtype=np.int32)
+    tops = np.full(cols, -1, dtype=np.int32)
+    if len(run_cols):
+        # Runs are grouped by column; order each group by length, keep the last
+        order = np.lexsort((run_lengths, run_cols))
+        sorted_cols = run_cols[order]
+        longest = order[np.append(sorted_cols[1:] != sorted_cols[:-1], True)]
+        lengths[run_cols[longest]] = run_lengths[longest]
+        tops[run_cols[longest]] = run_starts[longest]
+    return lengths, tops
+
+def find_longest_contiguous_black_line(binary_image):
+    lengths, _ = vertical_run_profile(binary_image == 0)
+    return int(lengths.max()) if lengths.size else 0
+
+def find_longest_contiguous_non_black_line(binary_image):
+    lengths, _ = vertical_run_profile(binary_image > 0)
+    return int(lengths.max()) if lengths.size else 0
+
+# Per-column object height in cm for stepped or sloped parts, from the mask
+# returned by calculate_object_height; 0 where the column has no object
+def object_height_profile(mask, AB_cm, ab_pixels):
+    lengths, _ = vertical_run_profile(mask)
+    return lengths * (AB_cm / ab_pixels)
@@ -1,221 +1,308 @@
-import cv2
-import numpy as np
-import tkinter as tk
-from PIL import Image, ImageTk
-
-# Constants for the side view calculations
-AB_cm = 9
-OC_cm = 10
-BC_cm = 22
-
-# Initialize cameras
-cap_top = cv2.VideoCapture(0)  # Top camera
-cap_side = cv2.VideoCapture(2)  # Side camera
-
-def classify_and_measure(contour, pixel_to_cm_ratio):
-    approx = cv2.approxPolyDP(contour, 0.04 * cv2.arcLength(contour, True), True)
-    if len(approx) == 4:
-        x, y, w, h = cv2.boundingRect(approx)
-        width_cm = w / pixel_to_cm_ratio
-        height_cm = h / pixel_to_cm_ratio
-        return "Rectangle", (width_cm, height_cm)
-    else:
-        area = cv2.contourArea(contour)
-        if area > 0:
-            perimeter = cv2.arcLength(contour, True)
-            circularity = (4 * np.pi * area) / (perimeter * perimeter)
-            if circularity > 0.75:
-                (x, y), radius = cv2.minEnclosingCircle(contour)
-                diameter_cm = (2 * radius) / pixel_to_cm_ratio
-                return "Circle", diameter_cm
-    return None, None
-
-def process_top_frame(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    _, thresh = cv2.threshold(blurred, 50, 255, cv2.THRESH_BINARY_INV)
-    contours, _ = cv2.findContours(thresh, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
-    largest_contour = max(contours, key=cv2.contourArea)
-    x, y, w, h = cv2.boundingRect(largest_contour)
-    pixel_size_of_box = max(w, h)
-    pixel_to_cm_ratio = pixel_size_of_box / 10.0
-    cropped_frame = frame[y:y+h, x:x+w]
-    cropped_thresh = thresh[y:y+h, x:x+w]
-    cropped_contours, _ = cv2.findContours(cropped_thresh, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
-    shapes_within = []
-    largest_shape, largest_dimensions = None, None
-    if cropped_contours:
-        valid_contours = [c for c in cropped_contours if cv2.contourArea(c) < cv2.contourArea(largest_contour)]
-        if valid_contours:
-            largest_cropped_contour = max(valid_contours, key=cv2.contourArea)
-            largest_shape, largest_dimensions = classify_and_measure(largest_cropped_contour, pixel_to_cm_ratio)
-            cv2.drawContours(cropped_frame, [largest_cropped_contour], -1, (0, 255, 0), 2)
-            for contour in valid_contours:
-                if contour is not largest_cropped_contour:
-                    shape, dimensions = classify_and_measure(contour, pixel_to_cm_ratio)
-                    if shape and dimensions:
-                        shapes_within.append((shape, dimensions))
-    return cropped_frame, cropped_thresh, largest_shape, largest_dimensions, shapes_within, pixel_to_cm_ratio, x, y, w, h
-
-def calculate_object_distance_from_box_bottom(cropped_thresh, pixel_to_cm_ratio, box_bottom_y):
-    non_black_pixels = cropped_thresh > 0
-    vertical_lines = np.sum(non_black_pixels, axis=1)
-    object_distance_pixels = np.argmax(vertical_lines)
-    object_distance_cm = object_distance_pixels / pixel_to_cm_ratio
-    distance_from_box_bottom_cm = box_bottom_y / pixel_to_cm_ratio
-    return distance_from_box_bottom_cm
-
-def calculate_object_height(image, AB_cm, additional_distance_cm):
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    _, binary_image = cv2.threshold(gray_image, 50, 255, cv2.THRESH_BINARY_INV)
-    ab_pixels = find_longest_contiguous_black_line(binary_image)
-    hsv_image = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    lower_bound = np.array([5, 150, 150])
-    upper_bound = np.array([15, 255, 255])
-    mask = cv2.inRange(hsv_image, lower_bound, upper_bound)
-    white_floor_mask = cv2.inRange(gray_image, 200, 255)
-    mask = cv2.bitwise_and(mask, mask, mask=cv2.bitwise_not(white_floor_mask))
-    obj_height_pixels = find_longest_contiguous_non_black_line(mask)
-    pixel_to_cm_ratio = AB_cm / ab_pixels
-    height_cm = (obj_height_pixels * pixel_to_cm_ratio) + additional_distance_cm
-    return height_cm, mask
-
-def find_longest_contiguous_black_line(binary_image):
-    black_pixels = binary_image == 0
-    vertical_lines = np.sum(black_pixels, axis=1)
-    longest_black_line = max(vertical_lines) if np.any(vertical_lines) else 0
-    return longest_black_line
-
-def find_longest_contiguous_non_black_line(binary_image):
-    non_black_pixels = binary_image > 0
-    vertical_lines = np.sum(non_black_pixels, axis=1)
-    longest_non_black_line = max(vertical_lines) if np.any(vertical_lines) else 0
-    return longest_non_black_line
-
-def update_gui(top_frame, top_segmented, top_shape, top_dimensions, top_shapes_within, side_frame, side_segmented, side_height):
-    top_frame_pil = Image.fromarray(cv2.cvtColor(top_frame, cv2.COLOR_BGR2RGB))
-    top_segmented_pil = Image.fromarray(top_segmented)
-    side_frame_pil = Image.fromarray(cv2.cvtColor(side_frame, cv2.COLOR_BGR2RGB))
-    side_segmented_pil = Image.fromarray(side_segmented)
-    
-    top_frame_resized = top_frame_pil.resize((300, 300))
-    top_segmented_resized = top_segmented_pil.resize((300, 300))
-    side_frame_resized = side_frame_pil.resize((300, 300))
-    side_segmented_resized = side_segmented_pil.resize((300, 300))
-    
-    top_frame_tk = ImageTk.PhotoImage(top_frame_resized)
-    top_segmented_tk = ImageTk.PhotoImage(top_segmented_resized)
-    side_frame_tk = ImageTk.PhotoImage(side_frame_resized)
-    side_segmented_tk = ImageTk.PhotoImage(side_segmented_resized)
-    
-    label_top_frame.config(image=top_frame_tk)
-    label_top_frame.image = top_frame_tk
-    label_top_segmented.config(image=top_segmented_tk)
-    label_top_segmented.image = top_segmented_tk
-    label_side_frame.config(image=side_frame_tk)
-    label_side_frame.image = side_frame_tk
-    label_side_segmented.config(image=side_segmented_tk)
-    label_side_segmented.image = side_segmented_tk
-    
-    if top_shape:
-        if top_shape == "Rectangle":
-            top_shape_text = f"Overall Shape: {top_shape}, {top_dimensions[0]:.2f}cm x {top_dimensions[1]:.2f}cm"
-        elif top_shape == "Circle":
-            top_shape_text = f"Overall Shape: {top_shape}, Diameter: {top_dimensions:.2f}cm"
-    else:
-        top_shape_text = "No overall shape detected"
-
-    other_shapes_text = "Shapes within:\n"
-    for shape, dimensions in top_shapes_within:
-        if shape == "Rectangle":
-            other_shapes_text += f"{shape}: {dimensions[0]:.2f}cm x {dimensions[1]:.2f}cm\n"
-        elif shape == "Circle":
-            other_shapes_text += f"{shape}: Diameter {dimensions:.2f}cm\n"
-
-    result_text.set(top_shape_text)
-    other_shapes_result_text.set(other_shapes_text)
-    lbl_side_result.config(text=f"Object Height: {side_height:.2f} cm")
-
-def capture_all():
-    ret_top, top_frame = cap_top.read()
-    ret_side, side_frame = cap_side.read()
-    if ret_top and ret_side:
-        top_processed_frame, top_segmented, top_shape, top_dimensions, top_shapes_within, pixel_to_cm_ratio, x, y, w, h = process_top_frame(top_frame)
-        distance_from_box_bottom_cm = calculate_object_distance_from_box_bottom(top_segmented, pixel_to_cm_ratio, y)
-        side_height, side_segmented = calculate_object_height(side_frame, AB_cm, distance_from_box_bottom_cm)
-        update_gui(top_processed_frame, top_segmented, top_shape, top_dimensions, top_shapes_within, side_frame, side_segmented, side_height)
-
-def show_live_feeds():
-    ret_top, top_frame = cap_top.read()
-    ret_side, side_frame = cap_side.read()
-    if ret_top:
-        top_frame_pil = Image.fromarray(cv2.cvtColor(top_frame, cv2.COLOR_BGR2RGB))
-        top_frame_resized = top_frame_pil.resize((300, 300))
-        top_frame_tk = ImageTk.PhotoImage(top_frame_resized)
-        label_top_frame.config(image=top_frame_tk)
-        label_top_frame.image = top_frame_tk
-    if ret_side:
-        side_frame_pil = Image.fromarray(cv2.cvtColor(side_frame, cv2.COLOR_BGR2RGB))
-        side_frame_resized = side_frame_pil.resize((300, 300))
-        side_frame_tk = ImageTk.PhotoImage(side_frame_resized)
-        label_side_frame.config(image=side_frame_tk)
-        label_side_frame.image = side_frame_tk
-
-    window.after(10, show_live_feeds)
-
-# Initialize Tkinter window
-window = tk.Tk()
-window.title("Camera Calibration and Measurement")
-
-# Create layout
-frame_top = tk.Frame(window)
-frame_top.pack(side="left", padx=10, pady=10)
-
-frame_side = tk.Frame(window)
-frame_side.pack(side="right", padx=10, pady=10)
-
-label_top_frame = tk.Label(frame_top)
-label_top_frame.pack()
-label_top_label = tk.Label(frame_top, text="Top Frame")
-label_top_label.pack()
-
-label_top_segmented = tk.Label(frame_top)
-label_top_segmented.pack()
-label_top_segmented_label = tk.Label(frame_top, text="Top Segmented")
-label_top_segmented_label.pack()
-
-label_side_frame = tk.Label(frame_side)
-label_side_frame.pack()
-label_side_label = tk.Label(frame_side, text="Side Frame")
-label_side_label.pack()
-
-label_side_segmented = tk.Label(frame_side)
-label_side_segmented.pack()
-label_side_segmented_label = tk.Label(frame_side, text="Side Segmented")
-label_side_segmented_label.pack()
-
-result_text = tk.StringVar()
-other_shapes_result_text = tk.StringVar()
-
-label_result = tk.Label(window, textvariable=result_text, font=("Helvetica", 16, "bold"))
-label_result.pack(side="top", pady=10)
-
-label_other_shapes = tk.Label(window, textvariable=other_shapes_result_text, font=("Helvetica", 12))
-label_other_shapes.pack(side="top", pady=5)
-
-lbl_side_result = tk.Label(window, text="Object Height: N/A", font=("Helvetica", 14))
-lbl_side_result.pack(side="top", pady=5)
-
-button_capture = tk.Button(window, text="Capture", command=capture_all, font=("Helvetica", 14))
-button_capture.pack(side="bottom", pady=10)
-
-# Start showing live feeds
-show_live_feeds()
-
-# Start Tkinter event loop
-window.mainloop()
-
-# Release cameras and close any open windows
-cap_top.release()
-cap_side.release()
-cv2.destroyAllWindows()
+import os
+import sys
+import cv2
+
+from measurement import (
+    process_top_frame,
+    calculate_object_distance_from_box_bottom,
+    calculate_object_height,
+)
+from calibration import DEFAULT_PROFILE_PATH, DriftMonitor, calibrate, load_profile, save_profile
+from aggregate import MeasurementAggregator
+from capture import open_captures
+from inspection import get_default_catalogue
+from motion import GATE_SETTLED, MotionGate
+from pipeline import LatestFrameWorker
+from pyramid import calculate_object_height_pyramid, process_top_frame_pyramid
+from resultstore import DEFAULT_DB_PATH, ResultStore
+from segmentation import get_default_segmenter
+from lens import DEFAULT_LENS_PATHS, profile_measurements
+
+# Constants for the side view calculations
+AB_cm = 9
+OC_cm = 10
+BC_cm = 22
+DISPLAY_FPS = 30  # Live feed redraw cap, independent of the camera rate
+PYRAMID_LEVELS = 0  # > 0 finds contours on a frame halved this many times and refines edges at full resolution
+
+# Capture keeps measuring until the 95% interval of every dimension is within tolerance
+AGGREGATE_TOLERANCE_CM = 0.05
+AGGREGATE_MIN_FRAMES = 3
+AGGREGATE_MAX_FRAMES = 30
+
+# Capture runs by itself once a newly placed part has been still this many frames
+AUTO_CAPTURE = True
+SETTLE_FRAMES = 5
+
+# Every capture is logged to the measurement log (resultstore.py); None disables it
+RESULTS_DB_PATH = DEFAULT_DB_PATH
+
+# True from the start of a capture until show_live_feeds has shown its result
+capturing = False
+
+# Cameras and the window are only created when run as a script, so importing
+# this module (e.g. for measure_frames) has no side effects
+
+def update_gui(top_frame, top_segmented, top_shape, top_dimensions, top_shapes_within, side_frame, side_segmented, side_height):
+    panel_top_frame.show(top_frame)
+    panel_top_segmented.show(top_segmented)
+    panel_side_frame.show(side_frame)
+    panel_side_segmented.show(side_segmented)
+
+    if top_shape:
+        if top_shape == "Rectangle":
+            top_shape_text = f"Overall Shape: {top_shape}, {top_dimensions[0]:.2f}cm x {top_dimensions[1]:.2f}cm"
+        elif top_shape == "Circle":
+            top_shape_text = f"Overall Shape: {top_shape}, Diameter: {top_dimensions:.2f}cm"
+    else:
+        top_shape_text = "No overall shape detected"
+
+    other_shapes_text = "Shapes within:\n"
+    for shape, dimensions in top_shapes_within:
+        if shape == "Rectangle":
+            other_shapes_text += f"{shape}: {dimensions[0]:.2f}cm x {dimensions[1]:.2f}cm\n"
+        elif shape == "Circle":
+            other_shapes_text += f"{shape}: Diameter {dimensions:.2f}cm\n"
+
+    result_text.set(top_shape_text)
+    other_shapes_result_text.set(other_shapes_text)
+    lbl_side_result.config(text=f"Object Height: {side_height:.2f} cm")
+
+def measure_top(frame, calibration=None, draw=True):
+    if PYRAMID_LEVELS:
+        return process_top_frame_pyramid(frame, calibration, PYRAMID_LEVELS, draw)
+    return process_top_frame(frame, calibration, draw)
+
+# Same signature as calculate_object_height, so lens.py can wrap it
+def measure_side(frame, ab_cm, additional_distance_cm, ab_pixels=None, segmenter=None):
+    if PYRAMID_LEVELS:
+        return calculate_object_height_pyramid(frame, ab_cm, additional_distance_cm, ab_pixels, segmenter,
+                                               levels=PYRAMID_LEVELS)
+    return calculate_object_height(frame, ab_cm, additional_distance_cm, ab_pixels, segmenter)
+
+# Measures one frame pair, with or without a calibration profile
+def measure_frames(top_frame, side_frame, profile=None):
+    if profile is None:
+        top_processed_frame, top_segmented, top_shape, top_dimensions, top_shapes_within, pixel_to_cm_ratio, x, y, w, h = measure_top(top_frame)
+        distance_from_box_bottom_cm = calculate_object_distance_from_box_bottom(top_segmented, pixel_to_cm_ratio, y)
+        side_height, side_segmented = measure_side(side_frame, AB_cm, distance_from_box_bottom_cm)
+    else:
+        # Lens-corrected when the profile was made with lens files (lens.py)
+        top_fn, side_fn = profile_measurements(profile, measure_top, measure_side)
+        top_processed_frame, top_segmented, top_shape, top_dimensions, top_shapes_within = top_fn(top_frame, profile["top"])[:5]
+        side = profile["side"]
+        side_height, side_segmented = side_fn(side_frame, side["ab_cm"], side["offset_cm"], side["ab_pixels"])
+    return top_processed_frame, top_segmented, top_shape, top_dimensions, top_shapes_within, side_frame, side_segmented, side_height
+
+# Measures consecutive frames until the aggregated dimensions are stable.
+# Runs on the capture worker thread, which has the cameras to itself until
+# show_live_feeds has taken the result, so the window stays responsive. A
+# frame without a box or reference bar must not end the worker, so errors
+# are returned rather than raised.
+def capture_all(request):
+    try:
+        aggregator = MeasurementAggregator(AGGREGATE_TOLERANCE_CM, AGGREGATE_MIN_FRAMES, AGGREGATE_MAX_FRAMES)
+        last, drift = None, None
+        while not aggregator.done():
+            ret_top, top_frame = cap_top.read()
+            ret_side, side_frame = cap_side.read()
+            if not (ret_top and ret_side):
+                break
+            if profile is not None:
+                drift = drift_monitor.update(top_frame, side_frame)
+            last = measure_frames(top_frame, side_frame, profile)
+            aggregator.add(last[2], last[3], last[7])
+        result = {"drift": drift, "last": last}
+        if last is None:
+            return result
+        top_shape, top_dimensions, side_height, _ = aggregator.result()
+        result.update(aggregate=(top_shape, top_dimensions, side_height), frames=aggregator.frames)
+        record = {
+            "shape": top_shape,
+            "dimensions": top_dimensions,
+            "shapes_within": [{"shape": shape, "dimensions": dimensions} for shape, dimensions in last[4]],
+            "height_cm": side_height,
+            "calibration_id": profile["calibration_id"] if profile else None,
+        }
+        if catalogue is not None:
+            result["inspection"] = catalogue.inspect(record)
+        if results_store is not None:
+            results_store.add(record)
+        return result
+    except Exception as exc:
+        return {"error": exc}
+
+# Shows a capture_all result; Tk thread only
+def show_capture(result):
+    if "error" in result:
+        exc = result["error"]
+        result_text.set(f"Measurement failed: {type(exc).__name__}: {exc}")
+        lbl_frames.config(text="")
+        return
+    drift = result["drift"]
+    if drift is not None:
+        lbl_calibration.config(text="Calibration drift: " + ", ".join(drift) + " - recalibrate" if drift else f"Calibration: {profile['calibration_id']}")
+    if result["last"] is None:
+        lbl_frames.config(text="")
+        return
+    top_shape, top_dimensions, side_height = result["aggregate"]
+    top_processed_frame, top_segmented, _, _, top_shapes_within, side_frame, side_segmented, _ = result["last"]
+    update_gui(top_processed_frame, top_segmented, top_shape, top_dimensions, top_shapes_within, side_frame, side_segmented, side_height)
+    lbl_frames.config(text=f"Aggregated over {result['frames']} frames")
+    inspection = result.get("inspection")
+    if inspection is not None:
+        verdict = "PASS" if inspection["pass"] else "FAIL"
+        lbl_inspection.config(text=f"{verdict}: {inspection['part_id'] or 'unknown part'}\n" + "\n".join(inspection["failures"]),
+                              fg="green" if inspection["pass"] else "red")
+
+def start_capture():
+    global capturing
+    if not capturing:
+        capturing = True
+        lbl_frames.config(text="Measuring...")
+        capture_worker.submit(True)
+
+def calibrate_cameras():
+    global profile, drift_monitor
+    # The capture worker is using the cameras and the profile
+    if capturing:
+        return
+    ret_top, top_frame = cap_top.read()
+    ret_side, side_frame = cap_side.read()
+    if ret_top and ret_side:
+        try:
+            # Lens files from lens.py, where present, correct both cameras
+            lenses = tuple(path if os.path.exists(path) else None for path in DEFAULT_LENS_PATHS)
+            profile = calibrate(top_frame, side_frame, AB_cm, lenses)
+        except ValueError as exc:
+            lbl_calibration.config(text=f"Calibration failed: {exc}")
+            return
+        save_profile(profile, DEFAULT_PROFILE_PATH)
+        drift_monitor = DriftMonitor(profile, interval=100)
+        lbl_calibration.config(text=f"Calibration: {profile['calibration_id']}")
+
+def show_live_feeds():
+    global capturing
+    if capturing:
+        # The cameras belong to the capture worker until its result is in
+        result = capture_worker.latest_result()
+        if result is not None:
+            capturing = False
+            show_capture(result)
+    else:
+        ret_top, top_frame = cap_top.read()
+        ret_side, side_frame = cap_side.read()
+        if AUTO_CAPTURE and ret_top and motion_gate.update(top_frame) == GATE_SETTLED:
+            start_capture()
+        if display_limiter.due():
+            if ret_top:
+                panel_top_frame.show(top_frame)
+            if ret_side:
+                panel_side_frame.show(side_frame)
+
+    window.after(10, show_live_feeds)
+
+if __name__ == "__main__":
+    # Tk and PIL are only loaded for the window
+    import tkinter as tk
+    from display import Panel, FrameRateLimiter
+
+    # Initialize cameras
+    # A recording directory argument (see recording.py) replays it instead
+    RECORDING = sys.argv[1] if len(sys.argv) > 1 else None
+    cap_top, cap_side = open_captures(0, 2, RECORDING)  # Top camera, side camera
+
+    results_store = ResultStore(RESULTS_DB_PATH).start() if RESULTS_DB_PATH else None
+
+    # Colour tables (segmentation.py) are built now rather than in the first capture
+    get_default_segmenter()
+
+    # Stored calibration, used as-is instead of re-detecting the references
+    profile = load_profile(DEFAULT_PROFILE_PATH) if os.path.exists(DEFAULT_PROFILE_PATH) else None
+    drift_monitor = DriftMonitor(profile, interval=100) if profile else None
+
+    # Part catalogue (inspection.py) for pass/fail, when parts.json exists
+    catalogue = get_default_catalogue()
+
+    # Initialize Tkinter window
+    window = tk.Tk()
+    window.title("Camera Calibration and Measurement")
+
+    # Create layout
+    frame_top = tk.Frame(window)
+    frame_top.pack(side="left", padx=10, pady=10)
+
+    frame_side = tk.Frame(window)
+    frame_side.pack(side="right", padx=10, pady=10)
+
+    label_top_frame = tk.Label(frame_top)
+    label_top_frame.pack()
+    label_top_label = tk.Label(frame_top, text="Top Frame")
+    label_top_label.pack()
+
+    label_top_segmented = tk.Label(frame_top)
+    label_top_segmented.pack()
+    label_top_segmented_label = tk.Label(frame_top, text="Top Segmented")
+    label_top_segmented_label.pack()
+
+    label_side_frame = tk.Label(frame_side)
+    label_side_frame.pack()
+    label_side_label = tk.Label(frame_side, text="Side Frame")
+    label_side_label.pack()
+
+    label_side_segmented = tk.Label(frame_side)
+    label_side_segmented.pack()
+    label_side_segmented_label = tk.Label(frame_side, text="Side Segmented")
+    label_side_segmented_label.pack()
+
+    # Panels reuse one PhotoImage each instead of allocating a new one per frame
+    panel_top_frame = Panel(label_top_frame)
+    panel_top_segmented = Panel(label_top_segmented)
+    panel_side_frame = Panel(label_side_frame)
+    panel_side_segmented = Panel(label_side_segmented)
+    display_limiter = FrameRateLimiter(DISPLAY_FPS)
+    motion_gate = MotionGate(settle_frames=SETTLE_FRAMES)
+
+    result_text = tk.StringVar()
+    other_shapes_result_text = tk.StringVar()
+
+    label_result = tk.Label(window, textvariable=result_text, font=("Helvetica", 16, "bold"))
+    label_result.pack(side="top", pady=10)
+
+    label_other_shapes = tk.Label(window, textvariable=other_shapes_result_text, font=("Helvetica", 12))
+    label_other_shapes.pack(side="top", pady=5)
+
+    lbl_side_result = tk.Label(window, text="Object Height: N/A", font=("Helvetica", 14))
+    lbl_side_result.pack(side="top", pady=5)
+
+    lbl_calibration = tk.Label(window, text=f"Calibration: {profile['calibration_id']}" if profile else "Calibration: none (per-frame)", font=("Helvetica", 10))
+    lbl_calibration.pack(side="top", pady=5)
+
+    lbl_frames = tk.Label(window, text="", font=("Helvetica", 10))
+    lbl_frames.pack(side="top", pady=5)
+
+    lbl_inspection = tk.Label(window, text="", font=("Helvetica", 16, "bold"))
+    lbl_inspection.pack(side="top", pady=5)
+
+    button_capture = tk.Button(window, text="Capture", command=start_capture, font=("Helvetica", 14))
+    button_capture.pack(side="bottom", pady=10)
+
+    button_calibrate = tk.Button(window, text="Calibrate", command=calibrate_cameras, font=("Helvetica", 12))
+    button_calibrate.pack(side="bottom", pady=5)
+
+    # Captures aggregate over many frames, so they run off the Tk thread
+    capture_worker = LatestFrameWorker(capture_all, workers=1).start()
+
+    # Start showing live feeds
+    show_live_feeds()
+
+    # Start Tkinter event loop
+    window.mainloop()
+
+    # Release cameras and close any open windows
+    capture_worker.stop()
+    cap_top.release()
+    cap_side.release()
+    if results_store is not None:
+        results_store.close()
+    cv2.destroyAllWindows()
@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+# Change gate: decides from tiny downsampled frames whether a frame is worth
+# measuring at all.
+#
+# Every frame is shrunk to a 64x48 grey thumbnail (a cheap bilinear step to
+# 256x192 followed by area averaging, about 0.5 ms at 1080p) and compared
+# with the previous thumbnail. While the scene changes the gate reports
+# MOVING; once it has been still for settle_frames frames and differs from
+# the scene at the last settle, it reports SETTLED exactly once, so a newly
+# placed part is measured one time after the operator's hand is gone. All
+# other frames are STATIC. Thresholds are mean absolute grey-level
+# differences (0-255) per thumbnail pixel.
+
+GATE_STATIC = "static"
+GATE_MOVING = "moving"
+GATE_SETTLED = "settled"
+
+THUMBNAIL_SIZE = (64, 48)
+INTERMEDIATE_SIZE = (256, 192)
+
+class MotionGate:
+    def __init__(self, motion_threshold=3.0, change_threshold=6.0, settle_frames=5):
+        self.motion_threshold = motion_threshold
+        self.change_threshold = change_threshold
+        self.settle_frames = settle_frames
+        width, height = INTERMEDIATE_SIZE
+        self.intermediate = np.empty((height, width, 3), dtype=np.uint8)
+        width, height = THUMBNAIL_SIZE
+        self.small = np.empty((height, width, 3), dtype=np.uint8)
+        self.current = np.empty((height, width), dtype=np.uint8)
+        self.previous = np.empty((height, width), dtype=np.uint8)
+        self.reference = None  # Thumbnail of the scene at the last settle
+        self.started = False
+        self.still_frames = 0
+        # Armed from the start so a part already in place is measured once
+        self.armed = True
+
+    def thumbnail(self, frame):
+        cv2.resize(frame, INTERMEDIATE_SIZE, dst=self.intermediate, interpolation=cv2.INTER_LINEAR)
+        cv2.resize(self.intermediate, THUMBNAIL_SIZE, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.current)
+        return self.current
+
+    def difference(self, a, b):
+        return cv2.norm(a, b, cv2.NORM_L1) / a.size
+
+    def update(self, frame):
+        current = self.thumbnail(frame)
+        if not self.started:
+            self.started = True
+            self.current, self.previous = self.previous, current
+            return GATE_MOVING
+        motion = self.difference(current, self.previous)
+        self.current, self.previous = self.previous, current
+        if motion > self.motion_threshold:
+            self.still_frames = 0
+            self.armed = True
+            return GATE_MOVING
+        self.still_frames += 1
+        if not self.armed:
+            return GATE_STATIC
+        if self.still_frames < self.settle_frames:
+            return GATE_MOVING
+        self.armed = False
+        changed = self.reference is None or self.difference(current, self.reference) > self.change_threshold
+        self.reference = current.copy()
+        return GATE_SETTLED if changed else GATE_STATIC
+
+    # Measure again at the next settle even if the scene looks unchanged
+    def rearm(self):
+        self.armed = True
+        self.reference = None
@@ -0,0 +1,174 @@
+import collections
+import queue
+import threading
+
+from instrumentation import metrics
+
+# Latest-frame-wins processing.
+#
+# Producers submit() items (frame pairs) as fast as they arrive; worker
+# threads always take the newest pending item and anything that was not
+# picked up in time is dropped instead of queueing up behind a slow stage.
+# OpenCV releases the GIL inside its kernels, so worker threads run in
+# parallel with each other and with the capture threads. Results go to a
+# bounded queue that the consumer (the Tk loop) drains at its own rate.
+# release, if given, is called with every item and result that is dropped
+# on the way, e.g. to hand pooled frames back to their FramePool.
+
+class LatestFrameWorker:
+    def __init__(self, process_fn, workers=1, max_results=4, release=None):
+        self.process_fn = process_fn
+        self.release = release
+        self.workers = workers
+        self.results = queue.Queue(maxsize=max_results)
+        self.condition = threading.Condition()
+        self.pending = None
+        self.running = False
+        self.threads = []
+        self.submitted = 0
+        self.dropped = 0
+        self.processed = 0
+        self.errors = 0
+
+    def start(self):
+        self.running = True
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    # Never blocks: replaces the pending item if workers are still busy
+    def submit(self, item):
+        with self.condition:
+            self.submitted += 1
+            if self.pending is not None:
+                self.dropped += 1
+                metrics.count("pipeline.dropped")
+                self._release(self.pending)
+            self.pending = item
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                item, self.pending = self.pending, None
+            try:
+                with metrics.stage("pipeline.process"):
+                    result = self.process_fn(item)
+            except Exception:
+                self.errors += 1
+                metrics.count("pipeline.errors")
+                self._release(item)
+                continue
+            self.processed += 1
+            self._put(result)
+
+    # A full result queue means the consumer is behind; drop the oldest
+    def _put(self, result):
+        while True:
+            try:
+                self.results.put_nowait(result)
+                return
+            except queue.Full:
+                try:
+                    self._release(self.results.get_nowait())
+                except queue.Empty:
+                    pass
+
+    # Newest available result, or None; older ones are discarded
+    def latest_result(self):
+        result = None
+        while True:
+            try:
+                newer = self.results.get_nowait()
+            except queue.Empty:
+                return result
+            if result is not None:
+                self._release(result)
+            result = newer
+
+    def _release(self, entry):
+        if self.release is not None:
+            self.release(entry)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        if self.pending is not None:
+            self._release(self.pending)
+            self.pending = None
+
+# Latest-item-wins processing shared by several producers (stations).
+#
+# Every producer keeps at most one pending item, and producers with work are
+# served round-robin, so a station running at a high frame rate cannot
+# starve the others. Items of one producer are never processed concurrently,
+# which keeps per-producer state such as ROI trackers free of locking. The
+# scheduler calls producer.process(item); delivering results is up to the
+# producer.
+class FairScheduler:
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.ready = collections.deque()
+        self.busy = set()
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    # Never blocks; returns True when an unprocessed item was replaced
+    def submit(self, producer, item):
+        with self.condition:
+            replaced = producer in self.pending
+            self.pending[producer] = item
+            if replaced:
+                metrics.count("pipeline.dropped")
+            elif producer not in self.busy:
+                self.ready.append(producer)
+                self.condition.notify()
+            return replaced
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.ready:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                producer = self.ready.popleft()
+                item = self.pending.pop(producer)
+                self.busy.add(producer)
+            try:
+                with metrics.stage("pipeline.process"):
+                    producer.process(item)
+            except Exception:
+                metrics.count("pipeline.errors")
+            with self.condition:
+                self.busy.discard(producer)
+                # Back to the end of the line if more work arrived meanwhile
+                if producer in self.pending:
+                    self.ready.append(producer)
+                    self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,269 @@
+import cv2
+import numpy as np
+
+from instrumentation import metrics
+from measurement import (
+    SHAPE_CIRCLE,
+    SHAPE_DTYPE,
+    SHAPE_NONE,
+    SHAPE_RECTANGLE,
+    classify_contours,
+    contour_stats,
+    detect_top,
+    find_longest_contiguous_non_black_line,
+    split_records,
+    vertical_run_profile,
+)
+from segmentation import get_default_segmenter
+
+# Coarse-to-fine measurement: full-resolution accuracy at low-resolution cost.
+#
+# Detection (thresholding, contours, classification, side-view segmentation)
+# runs on a reduced pyramid level, `levels` halvings of the frame. Every
+# detected edge is then re-measured on full-resolution pixels, but only in a
+# narrow strip across it: the grey levels of the strip are turned into the
+# fraction of each pixel covered by the object, and the edge lies where the
+# summed coverage says it does. That places straight edges to a fraction of
+# a pixel, where contour bounding boxes are off by up to a pixel. Circles
+# and features that are small at the reduced level are measured from the
+# coverage of a small full-resolution window around them instead. Features
+# of only a pixel or two at the reduced level are not detected at all, so
+# `levels` has to suit the smallest hole.
+
+DEFAULT_LEVELS = 2
+MIN_CONTRAST = 20  # grey levels between object and surroundings for a refinement
+SMALL_FEATURE = 16  # reduced-level pixels; smaller features are classified at full resolution
+
+# Bilinear reduction; unlike cv2.pyrDown or INTER_AREA it only reads a few
+# pixels per output pixel, and the Gaussian blur of threshold_top follows
+def downscale(image, levels):
+    height, width = image.shape[:2]
+    return cv2.resize(image, (width >> levels, height >> levels), interpolation=cv2.INTER_LINEAR)
+
+# Refinement reads small windows of the colour frame and converts only those
+def grey(window):
+    return window if window.ndim == 2 else cv2.cvtColor(window, cv2.COLOR_BGR2GRAY)
+
+# Sub-pixel (low, high) edges along x (axis=1) or y (axis=0) of an object
+# spanning roughly [low, high) in full-resolution pixels, measured over the
+# band [band_low, band_high) of the other axis. Edges that cannot be refined
+# keep their estimate.
+def refine_extent(image, low, high, band_low, band_high, margin, axis=1):
+    size = image.shape[axis]
+    band_low, band_high = max(0, int(band_low)), min(image.shape[1 - axis], int(band_high))
+    margin = int(min(margin, (high - low) // 2))
+    if margin < 3 or band_high <= band_low:
+        return float(low), float(high)
+    edges = []
+    for edge, object_after in ((int(round(low)), True), (int(round(high)), False)):
+        start, stop = edge - margin, edge + margin
+        if start < 0 or stop > size:
+            edges.append(float(edge))
+            continue
+        if axis == 1:
+            profile = grey(image[band_low:band_high, start:stop]).mean(axis=0)
+        else:
+            profile = grey(image[start:stop, band_low:band_high]).mean(axis=1)
+        outside, inside = (profile[:2].mean(), profile[-2:].mean()) if object_after else (profile[-2:].mean(), profile[:2].mean())
+        if abs(inside - outside) < MIN_CONTRAST:
+            edges.append(float(edge))
+            continue
+        coverage = np.clip((profile - outside) / (inside - outside), 0, 1).sum()
+        edges.append(stop - coverage if object_after else start + coverage)
+    return edges[0], edges[1]
+
+# Sub-pixel (x0, y0, x1, y1) edges of a box found at a reduced level; box is
+# (x, y, w, h) in reduced-level pixels. The bands leave out the corners.
+# The bounding box of a hole contour runs along the pixels around the hole
+# and the reduced level blurs edges by about a pixel, so the estimate can be
+# three reduced-level pixels off.
+def refine_box(image, box, scale):
+    x, y, w, h = box
+    x0, y0, x1, y1 = x * scale, y * scale, (x + w) * scale, (y + h) * scale
+    margin = 3 * scale + 2
+    left, right = refine_extent(image, x0, x1, y0 + (y1 - y0) / 4, y1 - (y1 - y0) / 4, margin, axis=1)
+    top, bottom = refine_extent(image, y0, y1, x0 + (x1 - x0) / 4, x1 - (x1 - x0) / 4, margin, axis=0)
+    return left, top, right, bottom
+
+# (area, width, height) in full-resolution pixels of a small feature or a
+# circle found at a reduced level, from the coverage of a full-resolution
+# window around it: the window border gives the surrounding grey level, the
+# middle of the feature its own. Width and height are the mean coverage of
+# the central rows and columns.
+def refine_feature(image, box, scale):
+    x, y, w, h = box
+    margin = scale + 2
+    x0, y0 = x * scale - margin, y * scale - margin
+    x1, y1 = (x + w) * scale + margin, (y + h) * scale + margin
+    if x0 < 0 or y0 < 0 or x1 > image.shape[1] or y1 > image.shape[0]:
+        return None
+    window = grey(image[y0:y1, x0:x1]).astype(np.float32)
+    rows, cols = window.shape
+    outside = (window[0].sum() + window[-1].sum() + window[1:-1, 0].sum() + window[1:-1, -1].sum()) / (2 * (rows + cols) - 4)
+    inside = window[rows * 2 // 5:rows * 3 // 5 + 1, cols * 2 // 5:cols * 3 // 5 + 1].mean()
+    if abs(inside - outside) < MIN_CONTRAST:
+        return None
+    covered = np.clip((window - outside) / (inside - outside), 0, 1)
+    width = covered[rows * 3 // 8:rows * 5 // 8 + 1].sum() / (rows * 5 // 8 + 1 - rows * 3 // 8)
+    height = covered[:, cols * 3 // 8:cols * 5 // 8 + 1].sum() / (cols * 5 // 8 + 1 - cols * 3 // 8)
+    return float(covered.sum()), float(width), float(height)
+
+# Shape of a feature from its coverage: an axis-aligned rectangle fills its
+# extent, a circle pi/4 of it. Anything else keeps the reduced-level shape.
+def shape_from_fill(area, width, height, shape):
+    fill = area / (width * height) if width * height else 0
+    if fill > 0.9:
+        return SHAPE_RECTANGLE
+    if abs(fill - np.pi / 4) < 0.07 and abs(width - height) <= 0.1 * max(width, height):
+        return SHAPE_CIRCLE
+    return shape
+
+# Replaces the sizes of classify_contours records found at a reduced level
+# with refined full-resolution ones, in place. boxes are the reduced-level
+# bounding boxes (contour_stats) and origin the reduced-level position of the
+# area the contours were found in. Features that are small at the reduced
+# level, where circles come out as polygons, are also classified again.
+def refine_records(image, records, boxes, scale, pixel_to_cm_ratio, origin=(0, 0)):
+    ox, oy = origin
+    for record in records:
+        x, y, w, h = (int(v) for v in boxes[record["index"]])
+        box = (x + ox, y + oy, w, h)
+        small = min(w, h) < SMALL_FEATURE
+        if small or record["shape"] == SHAPE_CIRCLE:
+            feature = refine_feature(image, box, scale)
+            if feature is None:
+                continue
+            area, width, height = feature
+            if small:
+                record["shape"] = shape_from_fill(area, width, height, record["shape"])
+            if record["shape"] == SHAPE_RECTANGLE:
+                record["width_cm"] = width / pixel_to_cm_ratio
+                record["height_cm"] = height / pixel_to_cm_ratio
+            elif record["shape"] == SHAPE_CIRCLE:
+                record["diameter_cm"] = 2 * np.sqrt(area / np.pi) / pixel_to_cm_ratio
+        elif record["shape"] == SHAPE_RECTANGLE:
+            left, top, right, bottom = refine_box(image, box, scale)
+            record["width_cm"] = (right - left) / pixel_to_cm_ratio
+            record["height_cm"] = (bottom - top) / pixel_to_cm_ratio
+    return records
+
+# process_top_frame on a reduced level with refined sizes; returns the same
+# tuple, with the box and scale in full-resolution pixels. The returned
+# threshold image is the reduced-level one.
+def process_top_frame_pyramid(frame, calibration=None, levels=DEFAULT_LEVELS, draw=True):
+    scale = 1 << levels
+    with metrics.stage("top.pyramid"):
+        small = downscale(frame, levels)
+    coarse_calibration = None
+    if calibration is not None:
+        coarse_calibration = {"reference_roi": [v // scale for v in calibration["reference_roi"]],
+                              "pixel_to_cm_ratio": calibration["pixel_to_cm_ratio"] / scale}
+    # Small features the reduced level cannot classify are kept for refine_records
+    thresh, contours, stats, box, pixel_to_cm_ratio, records, largest_index = detect_top(
+        small, coarse_calibration, keep_unclassified=True)
+    with metrics.stage("top.refine"):
+        if calibration is None:
+            left, top, right, bottom = refine_box(frame, box, scale)
+            pixel_to_cm_ratio = max(right - left, bottom - top) / 10.0
+            x, y = int(round(left)), int(round(top))
+            w, h = int(round(right)) - x, int(round(bottom)) - y
+            cropped_thresh = thresh[box[1]:box[1]+box[3], box[0]:box[0]+box[2]]
+            origin = (0, 0)
+        else:
+            x, y, w, h = (int(v) for v in calibration["reference_roi"])
+            pixel_to_cm_ratio = calibration["pixel_to_cm_ratio"]
+            cropped_thresh = thresh
+            origin = box[:2]
+        refine_records(frame, records, stats[2], scale, pixel_to_cm_ratio, origin)
+    cropped_frame = frame[y:y+h, x:x+w]
+    if draw and largest_index is not None:
+        cropped_frame = cropped_frame.copy()
+        contour = contours[largest_index] * scale + np.array(origin) * scale - (x, y)
+        cv2.drawContours(cropped_frame, [contour], -1, (0, 255, 0), 2)
+    records = records[records["shape"] != SHAPE_NONE]
+    largest_shape, largest_dimensions, shapes_within = split_records(records, largest_index)
+    return cropped_frame, cropped_thresh, largest_shape, largest_dimensions, shapes_within, pixel_to_cm_ratio, x, y, w, h
+
+# Length in full-resolution pixels of the longest vertical run of mask_fn
+# pixels, located on the reduced-level mask and counted at full resolution
+# in the few columns of the longest reduced-level run
+def refine_run(image, coarse_mask, scale, mask_fn):
+    lengths, tops = vertical_run_profile(coarse_mask)
+    if not lengths.size or not lengths.max():
+        return 0
+    column = int(np.argmax(lengths))
+    top, bottom = (tops[column] - 2) * scale, (tops[column] + lengths[column] + 2) * scale
+    strip = image[max(0, top):min(image.shape[0], bottom), column * scale:(column + 1) * scale]
+    return find_longest_contiguous_non_black_line(mask_fn(strip))
+
+# calculate_object_height on a reduced level, with the object height and (if
+# not given) the reference bar length counted at full resolution. Returns the
+# reduced-level mask.
+def calculate_object_height_pyramid(image, AB_cm, additional_distance_cm, ab_pixels=None, segmenter=None,
+                                    levels=DEFAULT_LEVELS):
+    scale = 1 << levels
+    if segmenter is None:
+        segmenter = get_default_segmenter()
+    small = cv2.resize(image, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_NEAREST)
+    if ab_pixels is None:
+        with metrics.stage("side.reference"):
+            def dark(strip):
+                return cv2.threshold(cv2.cvtColor(strip, cv2.COLOR_BGR2GRAY), 50, 255, cv2.THRESH_BINARY_INV)[1]
+            ab_pixels = refine_run(image, dark(small), scale, dark)
+    if not ab_pixels:
+        raise ValueError("side reference bar not found")
+    with metrics.stage("side.segment"):
+        mask = segmenter.mask(small)
+    with metrics.stage("side.runs"):
+        obj_height_pixels = refine_run(image, mask, scale, segmenter.mask)
+    height_cm = obj_height_pixels * (AB_cm / ab_pixels) + additional_distance_cm
+    return height_cm, mask
+
+# Quick top view used by sk_merged.py: outer contours only, the largest one
+# taken as the 10 cm box, with refined sizes. Returns the full-resolution
+# box crop, the reduced-level threshold of the box and the SHAPE_DTYPE
+# records of the contours smaller than the box with at least min_area
+# full-resolution pixels.
+def process_top_frame_outline(frame, levels=DEFAULT_LEVELS, min_area=100):
+    scale = 1 << levels
+    gray = cv2.cvtColor(downscale(frame, levels), cv2.COLOR_BGR2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, thresh = cv2.threshold(blurred, 50, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    if not contours:
+        return frame, thresh, np.zeros(0, dtype=SHAPE_DTYPE)
+
+    stats = contour_stats(contours)
+    areas, _, boxes, _ = stats
+    largest_index = int(np.argmax(areas))
+    x, y, w, h = (int(v) for v in boxes[largest_index])
+    left, top, right, bottom = refine_box(frame, (x, y, w, h), scale)
+    pixel_to_cm_ratio = max(right - left, bottom - top) / 10.0
+
+    cropped_frame = frame[y*scale:(y+h)*scale, x*scale:(x+w)*scale]
+    cropped_thresh = thresh[y:y+h, x:x+w]
+
+    # All contours smaller than the box, classified in one call; those too
+    # small to classify at the reduced level are classified by refine_records
+    records = classify_contours(contours, pixel_to_cm_ratio / scale, stats, np.flatnonzero(areas < areas[largest_index]),
+                                min_area=min_area / scale ** 2, keep_unclassified=True)
+    refine_records(frame, records, boxes, scale, pixel_to_cm_ratio)
+    return cropped_frame, cropped_thresh, records[records["shape"] != SHAPE_NONE]
+
+# Quick side view used by sk_merged.py: height of the largest dark contour,
+# refined at full resolution, scaled by AB_cm / ab_pixels. Returns the
+# reduced-level binary image, the height and the contour in frame pixels
+# (None when there is none); nothing is drawn into the frame.
+def calculate_outline_height(frame, AB_cm, ab_pixels, levels=DEFAULT_LEVELS):
+    scale = 1 << levels
+    gray = cv2.cvtColor(downscale(frame, levels), cv2.COLOR_BGR2GRAY)
+    _, binary = cv2.threshold(gray, 50, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return binary, 0, None
+    largest_contour = max(contours, key=cv2.contourArea)
+    x, y, w, h = cv2.boundingRect(largest_contour)
+    top, bottom = refine_extent(frame, y * scale, (y + h) * scale, (x + w / 4) * scale, (x + 3 * w / 4) * scale,
+                                3 * scale + 2, axis=0)
+    return binary, (bottom - top) * AB_cm / ab_pixels, largest_contour * scale
@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from cameras import load_camera_config
+from capture import CameraStream, FramePair, open_captures
+
+# Record-and-replay of synchronized camera streams.
+#
+# A recording is a directory holding, per camera, a raw frame store
+# (<name>.raw, frames back to back in capture order), an index of capture
+# timestamps (<name>.index, float64 seconds) and the frame shape in
+# meta.json. Reading memory-maps the store, so any frame can be reached
+# without decoding and worker processes can share the pages.
+#
+# ReplayCapture offers the cv2.VideoCapture methods the scripts use, so a
+# recording can stand in for a camera (see capture.open_capture), either at
+# the recorded pace or as fast as the consumer reads. replay_pairs() yields
+# timestamp-matched top/side pairs deterministically for offline runs.
+
+META_FILE = "meta.json"
+
+class Recorder:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.streams = {}
+        self.meta = {"cameras": {}}
+        self.error = None
+        self.failed = threading.Event()
+
+    # Thread-safe; every camera must keep one frame shape
+    def write(self, name, timestamp, frame):
+        with self.lock:
+            if name not in self.streams:
+                self.meta["cameras"][name] = {"shape": list(frame.shape), "dtype": str(frame.dtype), "frames": 0}
+                self.streams[name] = (open(os.path.join(self.directory, f"{name}.raw"), "wb"),
+                                      open(os.path.join(self.directory, f"{name}.index"), "wb"))
+            camera = self.meta["cameras"][name]
+            if list(frame.shape) != camera["shape"]:
+                raise ValueError(f"{name}: frame shape {frame.shape} differs from {tuple(camera['shape'])}")
+            raw, index = self.streams[name]
+            np.ascontiguousarray(frame).tofile(raw)
+            np.float64(timestamp).tofile(index)
+            camera["frames"] += 1
+
+    def write_pair(self, pair):
+        self.write("top", pair.top_time, pair.top)
+        self.write("side", pair.side_time, pair.side)
+
+    # Attaches to a running CameraStream and records every frame it captures.
+    # The listener runs on the capture thread, so a frame that cannot be
+    # written (changed shape, full disk) must not raise there: it stops the
+    # recording of every camera, the error is printed and kept in self.error
+    # and meta.json, and capture goes on.
+    def attach(self, stream):
+        def listener(timestamp, frame):
+            if self.failed.is_set():
+                return
+            try:
+                self.write(stream.name, timestamp, frame)
+            except ValueError as exc:
+                self.fail(str(exc))
+            except OSError as exc:
+                self.fail(f"{stream.name}: {exc}")
+        stream.listeners.append(listener)
+
+    def fail(self, message):
+        with self.lock:
+            if self.failed.is_set():
+                return
+            self.error = self.meta["error"] = message
+            self.failed.set()
+        print(f"Recording stopped: {message}", file=sys.stderr)
+
+    def close(self):
+        with self.lock:
+            for raw, index in self.streams.values():
+                raw.close()
+                index.close()
+            with open(os.path.join(self.directory, META_FILE), "w") as f:
+                json.dump(self.meta, f, indent=2)
+
+class RecordedStream:
+    def __init__(self, directory, name):
+        with open(os.path.join(directory, META_FILE)) as f:
+            camera = json.load(f)["cameras"][name]
+        self.timestamps = np.fromfile(os.path.join(directory, f"{name}.index"), dtype=np.float64)
+        count = min(camera["frames"], len(self.timestamps))
+        self.timestamps = self.timestamps[:count]
+        self.frames = np.memmap(os.path.join(directory, f"{name}.raw"), dtype=camera["dtype"], mode="r",
+                                shape=(count, *camera["shape"]))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+# Shared by the ReplayCaptures of one recording so that real-time replay
+# keeps the recorded offset between the cameras
+class ReplayClock:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.origin = None
+
+    def wait_until(self, recorded_time):
+        with self.lock:
+            if self.origin is None:
+                self.origin = time.monotonic() - recorded_time
+        delay = self.origin + recorded_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+class ReplayCapture:
+    def __init__(self, directory, name, realtime=True, loop=False, clock=None):
+        self.stream = RecordedStream(directory, name)
+        self.realtime = realtime
+        self.loop = loop
+        self.clock = clock or ReplayClock()
+        self.position = -1
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def grab(self):
+        if not self.opened:
+            return False
+        if self.position + 1 >= len(self.stream):
+            if not self.loop or not len(self.stream):
+                return False
+            self.position = -1
+            self.clock.origin = None
+        self.position += 1
+        if self.realtime:
+            self.clock.wait_until(self.stream.timestamps[self.position])
+        return True
+
+    # Frames are copied out of the memory map because processing draws into them
+    def retrieve(self, image=None):
+        if self.position < 0:
+            return False, None
+        if image is not None:
+            np.copyto(image, self.stream.frames[self.position])
+            return True, image
+        return True, np.array(self.stream.frames[self.position])
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    # Recorded capture time of the frame last grabbed
+    def timestamp(self):
+        return float(self.stream.timestamps[self.position])
+
+    def get(self, prop):
+        return 0.0
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        self.opened = False
+
+# Top frames of a recording with the side frame closest in time, skipping
+# top frames without a side frame within max_skew seconds
+def replay_pairs(directory, max_skew=0.010, start=0, stop=None):
+    top = RecordedStream(directory, "top")
+    side = RecordedStream(directory, "side")
+    if not len(top) or not len(side):
+        return
+    # Nearest side frame of every top frame, found for all frames at once
+    after = np.clip(np.searchsorted(side.timestamps, top.timestamps), 1, len(side) - 1)
+    before = after - 1
+    nearest = np.where(np.abs(side.timestamps[after] - top.timestamps) < np.abs(side.timestamps[before] - top.timestamps),
+                       after, before) if len(side) > 1 else np.zeros(len(top), dtype=np.intp)
+    skew = np.abs(side.timestamps[nearest] - top.timestamps)
+    for i in range(start, len(top) if stop is None else min(stop, len(top))):
+        if skew[i] <= max_skew:
+            j = nearest[i]
+            yield FramePair(np.array(top.frames[i]), np.array(side.frames[j]),
+                            float(top.timestamps[i]), float(side.timestamps[j]))
+
+# The cameras are opened with the same settings as for live measurement
+# (cameras.json, or config when given), so replays see the same frames
+def record(directory, top_source, side_source, seconds, config=None):
+    recorder = Recorder(directory)
+    cap_top, cap_side = open_captures(top_source, side_source, config=config)
+    streams = [CameraStream(cap_top, name="top"), CameraStream(cap_side, name="side")]
+    for stream in streams:
+        recorder.attach(stream)
+        stream.start()
+    try:
+        # Ends early when a frame could not be written
+        recorder.failed.wait(seconds)
+    except KeyboardInterrupt:
+        pass
+    for stream in streams:
+        stream.stop()
+    recorder.close()
+    return recorder.meta
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record the top and side cameras, or describe a recording.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="record both cameras into a directory")
+    record_parser.add_argument("directory")
+    record_parser.add_argument("--top", type=int, default=0, help="top camera index")
+    record_parser.add_argument("--side", type=int, default=2, help="side camera index")
+    record_parser.add_argument("--seconds", type=float, default=10.0, help="recording length (Ctrl-C stops early)")
+    record_parser.add_argument("--cameras", metavar="PATH", help="camera settings file (default: cameras.json if present)")
+    info_parser = subparsers.add_parser("info", help="print frame counts and rates of a recording")
+    info_parser.add_argument("directory")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        config = load_camera_config(args.cameras) if args.cameras else None
+        meta = record(args.directory, args.top, args.side, args.seconds, config)
+        for name, camera in meta["cameras"].items():
+            print(f"{name}: {camera['frames']} frames of {tuple(camera['shape'])}")
+        if meta.get("error"):
+            raise SystemExit(f"Recording stopped early: {meta['error']}")
+    else:
+        for name in ("top", "side"):
+            stream = RecordedStream(args.directory, name)
+            duration = stream.timestamps[-1] - stream.timestamps[0] if len(stream) > 1 else 0.0
+            rate = (len(stream) - 1) / duration if duration else 0.0
+            print(f"{name}: {len(stream)} frames of {stream.frames.shape[1:]}, {duration:.1f} s, {rate:.1f} fps")
+
+if __name__ == "__main__":
+    main()
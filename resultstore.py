@@ -0,0 +1,244 @@
+import argparse
+import json
+import math
+import queue
+import sqlite3
+import sys
+import threading
+import time
+
+# Measurement log: every measured part, for traceability and SPC.
+#
+# Results go to an SQLite database in WAL mode. add() only puts the record
+# on a queue; a writer thread commits whatever has queued up in one
+# transaction, at most every flush_interval seconds, so the measurement loop
+# never waits for the disk and one commit covers hundreds of rows. In WAL mode
+# readers (the queries below, another process) do not block the writer.
+# When the writer falls MAX_QUEUED records behind, further records are
+# counted in `dropped` instead of blocking. A transaction that fails (locked
+# database, full disk) is retried WRITE_ATTEMPTS times; then its records are
+# counted in `failed`, the error is printed and kept in `error`, and the
+# writer goes on with the next records.
+#
+# One row per measurement: wall-clock time, station, top shape with its
+# dimensions (width/length of a rectangle, diameter of a circle), side
+# height, the shapes within as JSON, calibration ID and, for failed
+# measurements, the error. Shift and outlier queries select on the time and
+# (station, time) indexes, so they read only the rows of the requested range.
+#
+#     python resultstore.py summary --hours 24
+#     python resultstore.py outliers --column height_cm --sigmas 3
+
+DEFAULT_DB_PATH = "measurements.db"
+BATCH_SIZE = 1000  # rows per transaction at most
+FLUSH_INTERVAL = 0.5  # seconds a record may wait for its transaction
+MAX_QUEUED = 100000
+WRITE_ATTEMPTS = 3
+SHIFT_HOURS = 8
+SHIFT_START_HOUR = 6  # local hour at which the first shift of a day starts
+DIMENSIONS = ("width_cm", "length_cm", "diameter_cm", "height_cm")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    time REAL NOT NULL,
+    station TEXT,
+    shape TEXT,
+    width_cm REAL,
+    length_cm REAL,
+    diameter_cm REAL,
+    height_cm REAL,
+    holes INTEGER,
+    shapes_within TEXT,
+    calibration_id TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS measurements_time ON measurements (time);
+CREATE INDEX IF NOT EXISTS measurements_station_time ON measurements (station, time);
+"""
+
+INSERT = ("INSERT INTO measurements (time, station, shape, width_cm, length_cm, diameter_cm, height_cm, holes, "
+          "shapes_within, calibration_id, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+def connect(path=DEFAULT_DB_PATH):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # With WAL a commit is durable against application crashes without an
+    # fsync per transaction; only a power loss can cost the last commits
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+# Row for a record as produced by batch.measure_pair (plus "station", "time"
+# and "calibration_id" where known); the defaults fill in missing keys
+def record_row(record, station=None, calibration_id=None):
+    shape, dimensions = record.get("shape"), record.get("dimensions")
+    width = length = diameter = None
+    if shape == "Rectangle":
+        width, length = (float(d) for d in dimensions)
+    elif shape == "Circle":
+        diameter = float(dimensions)
+    shapes_within = record.get("shapes_within") or []
+    height = record.get("height_cm")
+    return (record.get("time") or time.time(), record.get("station", station), shape, width, length, diameter,
+            None if height is None else float(height), len(shapes_within),
+            json.dumps(shapes_within) if shapes_within else None,
+            record.get("calibration_id", calibration_id), record.get("error"))
+
+class ResultStore:
+    def __init__(self, path=DEFAULT_DB_PATH, station=None, calibration_id=None, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.station = station
+        self.calibration_id = calibration_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(MAX_QUEUED)
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.error = None
+        self.thread = None
+        # Create the schema up front, so queries work before the first flush
+        connect(path).close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    # Never blocks; safe to call from any thread
+    def add(self, record):
+        try:
+            self.queue.put_nowait(record_row(record, self.station, self.calibration_id))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        # The connection belongs to this thread
+        conn = connect(self.path)
+        running = True
+        while running:
+            try:
+                rows = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # Collect for up to flush_interval after the first row
+            deadline = time.monotonic() + self.flush_interval
+            while rows[-1] is not None and len(rows) < self.batch_size:
+                try:
+                    rows.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            if rows[-1] is None:
+                running = False
+                rows.pop()
+            if rows:
+                self._write(conn, rows)
+        conn.close()
+
+    def _write(self, conn, rows):
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                with conn:
+                    conn.executemany(INSERT, rows)
+                self.written += len(rows)
+                return
+            except sqlite3.Error as exc:
+                self.error = exc
+                if attempt + 1 < WRITE_ATTEMPTS:
+                    time.sleep(self.flush_interval)
+        self.failed += len(rows)
+        print(f"Measurement log {self.path}: {len(rows)} records not written: {self.error}", file=sys.stderr)
+
+    # Writes everything queued so far, then stops the writer
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+# Unix time at which the shift containing `timestamp` started
+def shift_start(timestamp, shift_hours=SHIFT_HOURS, start_hour=SHIFT_START_HOUR):
+    local = time.localtime(timestamp)
+    origin = time.mktime((local.tm_year, local.tm_mon, local.tm_mday, start_hour, 0, 0, 0, 0, -1))
+    return origin + math.floor((timestamp - origin) / (shift_hours * 3600)) * shift_hours * 3600
+
+def range_filter(start, end, station, table=""):
+    where, params = [f"{table}time >= ?", f"{table}time < ?"], [start, end]
+    if station is not None:
+        where.append(f"{table}station = ?")
+        params.append(station)
+    return " AND ".join(where), params
+
+# Count, errors and mean/std/min/max of every dimension per station, shift
+# and shape for measurements in [start, end)
+def shift_summary(conn, start, end, station=None, shift_hours=SHIFT_HOURS, start_hour=SHIFT_START_HOUR):
+    origin, length = shift_start(start, shift_hours, start_hour), shift_hours * 3600
+    columns = ", ".join(f"COUNT({d}), AVG({d}), AVG({d} * {d}), MIN({d}), MAX({d})" for d in DIMENSIONS)
+    where, params = range_filter(start, end, station)
+    rows = conn.execute(
+        f"SELECT station, CAST((time - ?) / ? AS INTEGER) AS shift, shape, COUNT(*), COUNT(error), {columns} "
+        f"FROM measurements WHERE {where} GROUP BY station, shift, shape ORDER BY shift, station, shape",
+        [origin, length] + params)
+    summaries = []
+    for row in rows:
+        station_name, shift, shape, count, errors = row[:5]
+        summary = {"station": station_name, "shift_start": origin + shift * length, "shape": shape,
+                   "count": count, "errors": errors}
+        for i, name in enumerate(DIMENSIONS):
+            n, mean, mean_square, low, high = row[5 + 5 * i:10 + 5 * i]
+            if n:
+                std = math.sqrt(max(0.0, mean_square - mean * mean) * n / (n - 1)) if n > 1 else 0.0
+                summary[name] = {"mean": mean, "std": std, "min": low, "max": high}
+        summaries.append(summary)
+    return summaries
+
+# Measurements in [start, end) whose `column` is more than `sigmas` standard
+# deviations from the mean of their station and shape over the same range,
+# largest deviations first
+def outliers(conn, column, start, end, sigmas=3.0, station=None, limit=100):
+    if column not in DIMENSIONS:
+        raise ValueError(f"unknown column {column!r}, expected one of {', '.join(DIMENSIONS)}")
+    where, params = range_filter(start, end, station)
+    m_where, _ = range_filter(start, end, station, "m.")
+    rows = conn.execute(
+        f"WITH stats AS (SELECT station, shape, AVG({column}) AS mean, "
+        f"AVG({column} * {column}) - AVG({column}) * AVG({column}) AS var "
+        f"FROM measurements WHERE {where} AND {column} IS NOT NULL GROUP BY station, shape) "
+        f"SELECT m.id, m.time, m.station, m.shape, m.{column}, s.mean, s.var, m.calibration_id "
+        f"FROM measurements m JOIN stats s ON m.station IS s.station AND m.shape IS s.shape "
+        f"WHERE {m_where} AND m.{column} IS NOT NULL "
+        f"AND (m.{column} - s.mean) * (m.{column} - s.mean) > ? * s.var "
+        f"ORDER BY ABS(m.{column} - s.mean) DESC LIMIT ?",
+        params + params + [sigmas * sigmas, limit])
+    return [{"id": row_id, "time": t, "station": station_name, "shape": shape, column: value,
+             "mean": mean, "std": math.sqrt(max(var, 0.0)), "calibration_id": calibration_id}
+            for row_id, t, station_name, shape, value, mean, var, calibration_id in rows]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the measurement log.")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="measurement database")
+    parser.add_argument("--hours", type=float, default=24.0, help="look back this many hours")
+    parser.add_argument("--station", help="only this station")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("summary", help="per-shift count, mean, std, min and max of every dimension")
+    outlier_parser = commands.add_parser("outliers", help="measurements far from their station/shape mean")
+    outlier_parser.add_argument("--column", default="height_cm", choices=DIMENSIONS)
+    outlier_parser.add_argument("--sigmas", type=float, default=3.0)
+    outlier_parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    end = time.time()
+    start = end - args.hours * 3600
+    if args.command == "summary":
+        results = shift_summary(conn, start, end, args.station)
+    else:
+        results = outliers(conn, args.column, start, end, args.sigmas, args.station, args.limit)
+    for result in results:
+        sys.stdout.write(json.dumps(result) + "\n")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
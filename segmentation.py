@@ -0,0 +1,121 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+# Colour segmentation of the side view.
+#
+# A pixel belongs to the part when its HSV value lies in the range of one of
+# the configured part colours and its grey level is below the white floor.
+# By default the rules are applied per frame with OpenCV: one grey and one
+# HSV conversion, an inRange per colour and one masking step, all of which
+# OpenCV runs on every core.
+#
+# With table=True the rules are instead evaluated once for every BGR colour
+# (quantized to `bits` per channel) and frames are classified by looking the
+# packed pixel up in that table (BGRA conversion, shift, mask, np.take). The
+# lookup costs the same for any number of colours but runs on one thread,
+# while the OpenCV rules cost one inRange more per colour. At 1080p on one
+# core it took 8.0 ms against 8.2 ms for the OpenCV rules with one colour,
+# 7.4 against 15.8 ms with four and 6.9 against 23.5 ms with eight; with one
+# colour it is no faster, and slower where OpenCV has several cores. bits=8
+# gives exactly the OpenCV result; bits=6 moves bin edges by up to 3 levels,
+# which changed about 0.2-0.4% of the pixels of a 1080p side view. The
+# packed index assumes a little-endian host.
+#
+# The tables are built when the segmenter is created, which takes about
+# 0.4 s and 32 MB (two 16 MB tables) per process with bits=8 (0.02 s and
+# 8 MB with bits=6). get_default_segmenter() builds the configured one;
+# the scripts and batch.init_worker call it at startup so that no
+# measurement pays for it.
+
+DEFAULT_CONFIG_PATH = "segmentation.json"
+DEFAULT_COLOURS = [
+    {"name": "orange", "hsv_lower": [5, 150, 150], "hsv_upper": [15, 255, 255]},
+]
+WHITE_FLOOR_MIN = 200
+
+class ColourSegmenter:
+    def __init__(self, colours=DEFAULT_COLOURS, white_floor_min=WHITE_FLOOR_MIN, table=False, bits=8):
+        self.names = [colour["name"] for colour in colours]
+        self.ranges = [(np.array(colour["hsv_lower"]), np.array(colour["hsv_upper"])) for colour in colours]
+        self.white_floor_min = white_floor_min
+        self.table = table
+        if table:
+            self.build_tables(bits)
+
+    # The rules with OpenCV: a 0/255 mask, or with labelled=True the 1-based
+    # colour label of every pixel (the first matching colour wins)
+    def classify(self, image, labelled):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        result = np.zeros(gray.shape, dtype=np.uint8)
+        for label in range(len(self.ranges), 0, -1):
+            inside = cv2.inRange(hsv, *self.ranges[label - 1])
+            if labelled:
+                result[inside > 0] = label
+            else:
+                cv2.bitwise_or(result, inside, dst=result)
+        below_floor = cv2.inRange(gray, 0, self.white_floor_min - 1)
+        if labelled:
+            return cv2.bitwise_and(result, result, mask=below_floor)
+        return cv2.bitwise_and(result, below_floor)
+
+    def build_tables(self, bits):
+        self.shift = 8 - bits
+        channel_mask = (1 << bits) - 1
+        self.index_mask = channel_mask | channel_mask << 8 | channel_mask << 16
+
+        # Bin centres of every quantized colour, one plane of equal red at a
+        # time (green down, blue across) so the temporary images stay small
+        levels = ((np.arange(1 << bits, dtype=np.uint16) << self.shift) + ((1 << self.shift) >> 1)).astype(np.uint8)
+        plane = np.empty((1 << bits, 1 << bits, 3), dtype=np.uint8)
+        plane[..., 0] = levels[np.newaxis, :]
+        plane[..., 1] = levels[:, np.newaxis]
+        quantized = np.arange(1 << bits, dtype=np.uint32)
+        plane_index = (quantized[:, np.newaxis] << 8 | quantized[np.newaxis, :]).reshape(-1)
+        self.label_table = np.zeros(self.index_mask + 1, dtype=np.uint8)
+        for red, level in zip(quantized.tolist(), levels.tolist()):
+            plane[..., 2] = level
+            self.label_table[plane_index + (red << 16)] = self.classify(plane, labelled=True).reshape(-1)
+        self.mask_table = (self.label_table > 0).astype(np.uint8) * 255
+
+    # Quantized packed colour of every pixel, as a table index
+    def index(self, image):
+        packed = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA).view(np.uint32)[..., 0]
+        packed >>= self.shift
+        packed &= self.index_mask
+        return packed
+
+    # 255 where the pixel has any part colour, 0 elsewhere
+    def mask(self, image):
+        if self.table:
+            return np.take(self.mask_table, self.index(image))
+        return self.classify(image, labelled=False)
+
+    # 1-based index into self.names per pixel, 0 for background
+    def labels(self, image):
+        if self.table:
+            return np.take(self.label_table, self.index(image))
+        return self.classify(image, labelled=True)
+
+def load_segmenter(path=DEFAULT_CONFIG_PATH):
+    with open(path) as f:
+        config = json.load(f)
+    return ColourSegmenter(config.get("colours", DEFAULT_COLOURS),
+                           config.get("white_floor_min", WHITE_FLOOR_MIN),
+                           config.get("table", False), config.get("bits", 8))
+
+default_segmenter = None
+
+# Built on first use so that importing this module stays cheap; part colours
+# come from segmentation.json when present
+def get_default_segmenter():
+    global default_segmenter
+    if default_segmenter is None:
+        if os.path.exists(DEFAULT_CONFIG_PATH):
+            default_segmenter = load_segmenter(DEFAULT_CONFIG_PATH)
+        else:
+            default_segmenter = ColourSegmenter()
+    return default_segmenter
@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from email.parser import BytesParser
+from email.policy import HTTP
+
+import cv2
+import numpy as np
+
+from batch import AB_cm, init_worker, safe_measure_pair
+from calibration import load_profile
+
+# Local HTTP measurement service for image pairs captured elsewhere.
+#
+#     curl -F top=@part_top.png -F side=@part_side.png http://127.0.0.1:8080/measure
+#
+# Connections are handled by asyncio, so a slow client only ever holds its
+# own connection. Decoding and measuring run in a process pool; at most
+# max_pending pairs are queued or running; beyond that requests are
+# answered with 503 right away instead of piling up. Requests still running
+# after request_timeout seconds get a 504. When a worker dies the pool is
+# replaced and the requests it took down get a 503.
+
+MAX_BODY_BYTES = 32 * 1024 * 1024
+READ_TIMEOUT = 10.0  # seconds a client may take to send headers or body
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 408: "Request Timeout", 413: "Payload Too Large",
+           422: "Unprocessable Entity", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+# Runs in a pool worker: decoding there keeps the event loop free and means
+# only the compressed images are pickled
+def measure_encoded_pair(job):
+    top_bytes, side_bytes, ab_cm, profile = job
+    top_frame = cv2.imdecode(np.frombuffer(top_bytes, np.uint8), cv2.IMREAD_COLOR)
+    side_frame = cv2.imdecode(np.frombuffer(side_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if top_frame is None or side_frame is None:
+        return {"error": "could not decode image pair"}
+    return safe_measure_pair(top_frame, side_frame, ab_cm, profile)
+
+# "top" and "side" parts of a multipart/form-data body
+def parse_pair(content_type, body):
+    message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        return None, None
+    parts = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+             for part in message.iter_parts()}
+    return parts.get("top"), parts.get("side")
+
+class MeasurementServer:
+    def __init__(self, workers=os.cpu_count(), max_pending=None, request_timeout=10.0, ab_cm=AB_cm, profile=None):
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
+        # Two queued pairs per worker keep every core busy without a backlog
+        self.max_pending = max_pending or 2 * workers
+        self.pending = 0
+        self.request_timeout = request_timeout
+        self.ab_cm = ab_cm
+        self.profile = profile
+        self.stats = {"measured": 0, "rejected": 0, "timed_out": 0, "failed": 0}
+
+    async def measure(self, top_bytes, side_bytes):
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            return 503, {"error": "busy, retry later"}
+        pool = self.pool
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                pool, measure_encoded_pair, (top_bytes, side_bytes, self.ab_cm, self.profile))
+        except BrokenProcessPool:
+            return self.pool_broken(pool)
+        self.pending += 1
+
+        # The slot is freed when the worker is done, not when the client gives
+        # up, so timed-out work still counts against the pool
+        def release(_):
+            self.pending -= 1
+        future.add_done_callback(release)
+        try:
+            record = await asyncio.wait_for(asyncio.shield(future), self.request_timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            return 504, {"error": f"measurement took longer than {self.request_timeout} s"}
+        except BrokenProcessPool:
+            return self.pool_broken(pool)
+        if "error" in record:
+            self.stats["failed"] += 1
+            return 422, record
+        self.stats["measured"] += 1
+        return 200, record
+
+    # A worker died (e.g. killed by the OOM killer); the pool cannot be used
+    # any more, so it is replaced once for all requests that hit it
+    def pool_broken(self, pool):
+        self.stats["failed"] += 1
+        if pool is self.pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        return 503, {"error": "measurement worker failed, retry later"}
+
+    async def respond(self, method, path, headers, body):
+        if path == "/health" and method == "GET":
+            return 200, dict(self.stats, pending=self.pending, max_pending=self.max_pending)
+        if path != "/measure":
+            return 404, {"error": "not found"}
+        if method != "POST":
+            return 400, {"error": "POST top and side images to /measure"}
+        top_bytes, side_bytes = parse_pair(headers.get("content-type", ""), body)
+        if not top_bytes or not side_bytes:
+            return 400, {"error": "expected multipart/form-data with 'top' and 'side' files"}
+        return await self.measure(top_bytes, side_bytes)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader, writer), READ_TIMEOUT)
+                except asyncio.TimeoutError:
+                    await self.write_response(writer, 408, {"error": "request not received in time"}, False)
+                    break
+                except ValueError as exc:
+                    await self.write_response(writer, 400, {"error": str(exc)}, False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if body is None:
+                    await self.write_response(writer, 413, {"error": "body too large"}, False)
+                    break
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload = await self.respond(method, path, headers, body)
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # (method, path, lower-cased headers, body); body is None when too large.
+    # Clients sending "Expect: 100-continue" (curl for uploads over 1 MB)
+    # wait for the interim response before sending the body.
+    async def read_request(self, reader, writer):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3:
+            raise ValueError("malformed request line")
+        method, path, _ = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_BYTES:
+            return method, path, headers, None
+        if length and headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+        body = await reader.readexactly(length) if length else b""
+        return method, path.split("?")[0], headers, body
+
+    async def write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode() + b"\r\n" + body)
+        await writer.drain()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve top/side image pair measurements over local HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--workers", "-j", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--max-pending", type=int, help="pairs queued or running before requests get 503 (default: 2 per worker)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds before a request is answered with 504")
+    parser.add_argument("--ab-cm", type=float, default=AB_cm, help="length of the side-view reference bar in cm")
+    parser.add_argument("--profile", help="calibration profile to use instead of per-frame reference detection")
+    args = parser.parse_args(argv)
+
+    profile = load_profile(args.profile) if args.profile else None
+    server = MeasurementServer(args.workers, args.max_pending, args.timeout, args.ab_cm, profile)
+    print(f"Listening on http://{args.host}:{args.port}/measure", file=sys.stderr)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,205 +1,265 @@
+import os
+import sys
 import cv2
-import numpy as np
-import tkinter as tk
-from PIL import Image, ImageTk
 import threading
-import time
+
+from calibration import DEFAULT_PROFILE_PATH, load_profile
+from capture import FramePair, SyncedCapture, open_captures
+from framepool import FramePool
+from motion import GATE_SETTLED, MotionGate
+from pipeline import LatestFrameWorker
+from measurement import SHAPE_RECTANGLE, shape_tuple
+from pyramid import calculate_outline_height, process_top_frame_outline
+from instrumentation import metrics
+from resultstore import DEFAULT_DB_PATH, ResultStore
+
+# Cameras, workers and the window are only created when run as a script, so
+# importing this module (e.g. from a worker process) has no side effects.
 
 # Constants for side view calculations
 AB_cm = 9
-KNOWN_HEIGHT_PIXELS = 200  # Calibrated height in pixels from the side camera
-
-# Initialize cameras with reduced resolution for smoother processing
-cap_top = cv2.VideoCapture(0)  # Top camera
-cap_side = cv2.VideoCapture(2)  # Side camera
-cap_top.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-cap_top.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
-cap_side.set(cv2.CAP_PROP_FRAME_WIDTH, 320)
-cap_side.set(cv2.CAP_PROP_FRAME_HEIGHT, 240)
-
-# Global frame storage
-top_frame = None
-side_frame = None
-lock = threading.Lock()
+# Fallback AB length when no calibration profile exists. It was measured on
+# 320x240 frames and is scaled to the height of the frames measured now.
+KNOWN_HEIGHT_PIXELS = 200
+KNOWN_HEIGHT_FRAME_ROWS = 240
+MIN_CONTOUR_AREA = 100  # Ignore small contours
+
+# Every measured pair is logged to the measurement log (resultstore.py); None disables it
+RESULTS_DB_PATH = DEFAULT_DB_PATH
+results_store = None
+profile = None
+
+# Cameras run at full resolution; contours are found on a frame halved
+# PYRAMID_LEVELS times and their edges measured on the full one
+# (pyramid.py), which keeps the rate of a reduced capture resolution
+PYRAMID_LEVELS = 2
+
+PROCESSING_WORKERS = 2
+
+# One capture thread per camera; pairs are matched on grab timestamps.
+# Cameras decode into preallocated buffers: enough for the capture ring
+# buffer, the pending pair, one per worker, the result queue, the live
+# preview and the panels.
+MAX_FRAME_SKEW = 0.010  # seconds
+FRAME_POOL_SIZE = 14 + PROCESSING_WORKERS
+DISPLAY_FPS = 15  # Panel redraw cap, independent of the measurement rate
+
+# Per-stage timing; F2 toggles the overlay. The export path ending decides
+# the format: ".json", otherwise Prometheus textfile. None disables export.
+METRICS_EXPORT_PATH = None  # e.g. "/var/lib/node_exporter/textfile/component_verification.prom"
+METRICS_EXPORT_INTERVAL_MS = 5000
 run_flag = True
 
-# Threaded frame capture
+# With GATED_MEASUREMENT only a pair whose top view has settled after a change
+# is measured; every other pair is just shown as a live preview
+GATED_MEASUREMENT = True
+SETTLE_FRAMES = 5
+preview_lock = threading.Lock()
+preview_pair = None
+
+# Threaded frame capture: hand pairs to the workers, which keep only the newest
 def capture_frames():
-    global top_frame, side_frame, run_flag
+    global preview_pair
     while run_flag:
-        ret_top, frame_top = cap_top.read()
-        ret_side, frame_side = cap_side.read()
-        if ret_top and ret_side:
-            with lock:
-                top_frame = frame_top
-                side_frame = frame_side
-        time.sleep(0.01)
-
-def classify_and_measure(contour, pixel_to_cm_ratio):
-    if cv2.contourArea(contour) < 100:  # Ignore small contours
-        return None, None
-
-    approx = cv2.approxPolyDP(contour, 0.04 * cv2.arcLength(contour, True), True)
-    
-    if len(approx) == 4:
-        x, y, w, h = cv2.boundingRect(approx)
-        width_cm = w / pixel_to_cm_ratio
-        height_cm = h / pixel_to_cm_ratio
-        return "Rectangle", (width_cm, height_cm)
-    
-    area = cv2.contourArea(contour)
-    if area > 0:
-        perimeter = cv2.arcLength(contour, True)
-        circularity = (4 * np.pi * area) / (perimeter * perimeter)
-        if circularity > 0.75:
-            (x, y), radius = cv2.minEnclosingCircle(contour)
-            diameter_cm = (2 * radius) / pixel_to_cm_ratio
-            return "Circle", diameter_cm
-    
-    return None, None
-
-def process_top_frame(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-    _, thresh = cv2.threshold(blurred, 50, 255, cv2.THRESH_BINARY_INV)
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    if not contours:
-        return frame, thresh, []
-
-    largest_contour = max(contours, key=cv2.contourArea)
-    x, y, w, h = cv2.boundingRect(largest_contour)
-    pixel_to_cm_ratio = max(w, h) / 10.0
-
-    cropped_frame = frame[y:y+h, x:x+w]
-    cropped_thresh = thresh[y:y+h, x:x+w]
-    shapes_within = []
-
-    for contour in contours:
-        if cv2.contourArea(contour) < cv2.contourArea(largest_contour):
-            shape, dimensions = classify_and_measure(contour, pixel_to_cm_ratio)
-            if shape:
-                shapes_within.append((shape, dimensions))
-
-    return cropped_frame, cropped_thresh, shapes_within
-
-def process_side_frame(frame):
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    _, binary = cv2.threshold(gray, 50, 255, cv2.THRESH_BINARY_INV)
-
-    # Reference pixel-to-cm ratio using known object height
-    pixel_to_cm_ratio = AB_cm / KNOWN_HEIGHT_PIXELS
-
-    # Detect contour of the largest object
-    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if contours:
-        largest_contour = max(contours, key=cv2.contourArea)
-        x, y, w, h = cv2.boundingRect(largest_contour)
-        object_height = h * pixel_to_cm_ratio
-        cv2.drawContours(frame, [largest_contour], -1, (0, 255, 0), 2)
-    else:
-        object_height = 0
-
-    return binary, object_height
+        pair = synced_capture.read(timeout=0.5)
+        if pair is None:
+            continue
+        if not GATED_MEASUREMENT or motion_gate.update(pair.top) == GATE_SETTLED:
+            measurement_worker.submit(pair)
+            continue
+        with preview_lock:
+            replaced, preview_pair = preview_pair, pair
+        if replaced is not None:
+            replaced.release()
+
+def take_preview():
+    global preview_pair
+    with preview_lock:
+        pair, preview_pair = preview_pair, None
+    return pair
+
+# AB length in pixels of a side frame: from the profile, else the fallback
+def side_ab_pixels(frame):
+    if profile:
+        return profile["side"]["ab_pixels"]
+    return KNOWN_HEIGHT_PIXELS * frame.shape[0] / KNOWN_HEIGHT_FRAME_ROWS
+
+# Runs on a worker thread, never on the Tk main thread
+def process_pair(pair):
+    with metrics.stage("top.total"):
+        top_processed, top_segmented, shapes_within = process_top_frame_outline(pair.top, PYRAMID_LEVELS, MIN_CONTOUR_AREA)
+    with metrics.stage("side.total"):
+        side_segmented, object_height, side_contour = calculate_outline_height(pair.side, AB_cm, side_ab_pixels(pair.side),
+                                                                               PYRAMID_LEVELS)
+    if results_store is not None:
+        results_store.add({
+            "shapes_within": [dict(zip(("shape", "dimensions"), shape_tuple(s))) for s in shapes_within],
+            "height_cm": object_height,
+            "calibration_id": profile["calibration_id"] if profile else None,
+        })
+    return pair.top_time, top_processed, top_segmented, shapes_within, pair.side, side_segmented, object_height, side_contour, pair
+
+# Pairs and results the worker drops hand their frames back to the pools
+def release_frames(entry):
+    (entry if isinstance(entry, FramePair) else entry[-1]).release()
+
+last_shown_time = 0.0
 
 def update_gui():
-    with lock:
-        if top_frame is not None and side_frame is not None:
-            # Process frames
-            top_processed, top_segmented, shapes_within = process_top_frame(top_frame)
-            side_segmented, object_height = process_side_frame(side_frame)
-
+    global last_shown_time
+    # Results that arrive between redraws stay queued; only the newest is shown
+    due = display_limiter.due()
+    result = measurement_worker.latest_result() if due else None
+    # Between measurements the redraws show the live preview
+    if due and result is None and GATED_MEASUREMENT:
+        preview = take_preview()
+        if preview is not None:
+            with metrics.stage("gui.render"):
+                panel_top_frame.show(preview.top, preview.top_time)
+                panel_side_frame.show(preview.side, preview.side_time)
+            preview.release()
+    # With several workers a slower, older result may arrive after a newer one
+    if result is not None and result[0] <= last_shown_time:
+        release_frames(result)
+    elif result is not None:
+        last_shown_time, top_processed, top_segmented, shapes_within, side_frame, side_segmented, object_height, side_contour, pair = result
+
+        with metrics.stage("gui.render"):
             # Top Frame
-            top_frame_pil = Image.fromarray(cv2.cvtColor(top_processed, cv2.COLOR_BGR2RGB)).resize((300, 300))
-            top_segmented_pil = Image.fromarray(top_segmented).resize((300, 300))
-
-            top_frame_tk = ImageTk.PhotoImage(top_frame_pil)
-            top_segmented_tk = ImageTk.PhotoImage(top_segmented_pil)
-
-            label_top_frame.config(image=top_frame_tk)
-            label_top_frame.image = top_frame_tk
-            label_top_segmented.config(image=top_segmented_tk)
-            label_top_segmented.image = top_segmented_tk
+            panel_top_frame.show(top_processed, last_shown_time)
+            panel_top_segmented.show(top_segmented, last_shown_time)
 
             # Side Frame
-            side_frame_pil = Image.fromarray(cv2.cvtColor(side_frame, cv2.COLOR_BGR2RGB)).resize((300, 300))
-            side_segmented_pil = Image.fromarray(side_segmented).resize((300, 300))
+            panel_side_frame.show(side_frame, last_shown_time, None if side_contour is None else [side_contour])
+            panel_side_segmented.show(side_segmented, last_shown_time)
 
-            side_frame_tk = ImageTk.PhotoImage(side_frame_pil)
-            side_segmented_tk = ImageTk.PhotoImage(side_segmented_pil)
+        # The panels hold their own copies now
+        pair.release()
 
-            label_side_frame.config(image=side_frame_tk)
-            label_side_frame.image = side_frame_tk
-            label_side_segmented.config(image=side_segmented_tk)
-            label_side_segmented.image = side_segmented_tk
+        # Display Shape Info
+        if len(shapes_within):
+            shapes_text = "\n".join(
+                [f"Rectangle: {s['width_cm']:.2f}cm x {s['height_cm']:.2f}cm" if s["shape"] == SHAPE_RECTANGLE
+                 else f"Circle: Diameter {s['diameter_cm']:.2f}cm" for s in shapes_within]
+            )
+            shapes_result.set(shapes_text)
+        else:
+            shapes_result.set("No shapes detected")
 
-            # Display Shape Info
-            if shapes_within:
-                shapes_text = "\n".join(
-                    [f"{s[0]}: {s[1][0]:.2f}cm x {s[1][1]:.2f}cm" if isinstance(s[1], tuple) 
-                     else f"{s[0]}: Diameter {s[1]:.2f}cm" for s in shapes_within]
-                )
-                shapes_result.set(shapes_text)
-            else:
-                shapes_result.set("No shapes detected")
+        height_result.set(f"Object Height: {object_height:.2f} cm")
 
-            height_result.set(f"Object Height: {object_height:.2f} cm")
+        if show_metrics.get():
+            metrics_result.set(metrics.overlay_text())
 
     # Schedule next update
     window.after(30, update_gui)
 
-# GUI Setup
-window = tk.Tk()
-window.title("Camera Calibration and Measurement")
-
-# Frame Containers
-left_panel = tk.Frame(window)
-left_panel.pack(side="left")
-
-right_panel = tk.Frame(window)
-right_panel.pack(side="right")
-
-# Top Frames
-label_top_frame = tk.Label(left_panel)
-label_top_frame.pack()
-tk.Label(left_panel, text="Top Frame").pack()
-
-label_top_segmented = tk.Label(left_panel)
-label_top_segmented.pack()
-tk.Label(left_panel, text="Top Segmented").pack()
-
-# Side Frames
-label_side_frame = tk.Label(right_panel)
-label_side_frame.pack()
-tk.Label(right_panel, text="Side Frame").pack()
-
-label_side_segmented = tk.Label(right_panel)
-label_side_segmented.pack()
-tk.Label(right_panel, text="Side Segmented").pack()
-
-# Results
-shapes_result = tk.StringVar()
-label_shapes = tk.Label(window, textvariable=shapes_result, font=("Helvetica", 12))
-label_shapes.pack()
-
-height_result = tk.StringVar()
-label_height = tk.Label(window, textvariable=height_result, font=("Helvetica", 12))
-label_height.pack()
-
-# Start background thread for frame capture
-capture_thread = threading.Thread(target=capture_frames, daemon=True)
-capture_thread.start()
-
-# Start live update
-update_gui()
-
-# Start Tkinter event loop
-window.mainloop()
-
-# Cleanup
-run_flag = False
-capture_thread.join()
-cap_top.release()
-cap_side.release()
-cv2.destroyAllWindows()
-
+if __name__ == "__main__":
+    # Tk and PIL are only loaded for the window
+    import tkinter as tk
+    from display import Panel, FrameRateLimiter
+
+    results_store = ResultStore(RESULTS_DB_PATH).start() if RESULTS_DB_PATH else None
+
+    # Side scale from the calibration profile (see calibration.py), if present
+    profile = load_profile(DEFAULT_PROFILE_PATH) if os.path.exists(DEFAULT_PROFILE_PATH) else None
+    if profile:
+        AB_cm = profile["side"]["ab_cm"]
+
+    # A recording directory argument (see recording.py) replays it instead
+    RECORDING = sys.argv[1] if len(sys.argv) > 1 else None
+    cap_top, cap_side = open_captures(0, 2, RECORDING)  # Top camera, side camera
+    synced_capture = SyncedCapture(cap_top, cap_side, max_skew=MAX_FRAME_SKEW,
+                                   pools=(FramePool(FRAME_POOL_SIZE), FramePool(FRAME_POOL_SIZE)))
+    motion_gate = MotionGate(settle_frames=SETTLE_FRAMES)
+    measurement_worker = LatestFrameWorker(process_pair, workers=PROCESSING_WORKERS, release=release_frames)
+    metrics.enabled = True
+
+    # GUI Setup
+    window = tk.Tk()
+    window.title("Camera Calibration and Measurement")
+
+    # Frame Containers
+    left_panel = tk.Frame(window)
+    left_panel.pack(side="left")
+
+    right_panel = tk.Frame(window)
+    right_panel.pack(side="right")
+
+    # Top Frames
+    label_top_frame = tk.Label(left_panel)
+    label_top_frame.pack()
+    tk.Label(left_panel, text="Top Frame").pack()
+
+    label_top_segmented = tk.Label(left_panel)
+    label_top_segmented.pack()
+    tk.Label(left_panel, text="Top Segmented").pack()
+
+    # Side Frames
+    label_side_frame = tk.Label(right_panel)
+    label_side_frame.pack()
+    tk.Label(right_panel, text="Side Frame").pack()
+
+    label_side_segmented = tk.Label(right_panel)
+    label_side_segmented.pack()
+    tk.Label(right_panel, text="Side Segmented").pack()
+
+    # Panels reuse one PhotoImage each instead of allocating a new one per frame
+    panel_top_frame = Panel(label_top_frame)
+    panel_top_segmented = Panel(label_top_segmented)
+    panel_side_frame = Panel(label_side_frame)
+    panel_side_segmented = Panel(label_side_segmented)
+    display_limiter = FrameRateLimiter(DISPLAY_FPS)
+
+    # Results
+    shapes_result = tk.StringVar()
+    label_shapes = tk.Label(window, textvariable=shapes_result, font=("Helvetica", 12))
+    label_shapes.pack()
+
+    height_result = tk.StringVar()
+    label_height = tk.Label(window, textvariable=height_result, font=("Helvetica", 12))
+    label_height.pack()
+
+    # Timing overlay, hidden until F2 is pressed
+    show_metrics = tk.BooleanVar(value=False)
+    metrics_result = tk.StringVar()
+    label_metrics = tk.Label(window, textvariable=metrics_result, font=("Courier", 9), justify="left")
+
+    def toggle_metrics(event=None):
+        show_metrics.set(not show_metrics.get())
+        if show_metrics.get():
+            label_metrics.pack()
+        else:
+            label_metrics.pack_forget()
+
+    window.bind("<F2>", toggle_metrics)
+
+    def export_metrics():
+        if METRICS_EXPORT_PATH.endswith(".json"):
+            metrics.write_json(METRICS_EXPORT_PATH)
+        else:
+            metrics.write_prometheus(METRICS_EXPORT_PATH)
+        window.after(METRICS_EXPORT_INTERVAL_MS, export_metrics)
+
+    # Start camera threads, measurement workers and the pairing thread
+    synced_capture.start()
+    measurement_worker.start()
+    capture_thread = threading.Thread(target=capture_frames, daemon=True)
+    capture_thread.start()
+
+    # Start live update
+    update_gui()
+    if METRICS_EXPORT_PATH:
+        export_metrics()
+
+    # Start Tkinter event loop
+    window.mainloop()
+
+    # Cleanup
+    run_flag = False
+    capture_thread.join()
+    measurement_worker.stop()
+    synced_capture.stop()
+    if results_store is not None:
+        results_store.close()
+    cv2.destroyAllWindows()
@@ -0,0 +1,184 @@
+import argparse
+import collections
+import json
+import os
+import sys
+import threading
+import time
+
+from batch import AB_cm, safe_measure_pair
+from calibration import load_profile
+from cameras import load_camera_config
+from capture import SyncedCapture, open_captures
+from inspection import inspect_record, load_catalogue
+from instrumentation import Instrumentation, write_atomic
+from pipeline import FairScheduler
+from resultstore import ResultStore
+from segmentation import get_default_segmenter
+from tracking import RoiTracker
+
+# Several top/side inspection stations driven from one process.
+#
+# Each Station owns its camera pair (or a replayed recording), calibration
+# profile, ROI trackers and result stream. All stations share one
+# FairScheduler, so N worker threads serve them round-robin instead of N
+# copies of a script fighting over the cores. Every station keeps its own
+# instrumentation: "process" (measurement time) and "latency" (capture to
+# result) histograms plus submitted/dropped/errors counters, from which
+# stats() derives throughput.
+#
+# stations.json:
+#     {"workers": 4,
+#      "stations": [{"name": "line1", "top": 0, "side": 2, "profile": "line1.json", "output": "line1.jsonl"},
+#                   {"name": "line2", "top": 4, "side": 6, "pyramid": 2, "cameras": "line2_cameras.json",
+#                    "catalogue": "parts.json"}]}
+#
+# "pyramid" measures that station coarse-to-fine (pyramid.py) instead of at
+# full resolution throughout, and turns off tracking. A top-level
+# "database" logs the results of all stations to one measurement log
+# (resultstore.py). "cameras" names the camera settings file of a station
+# (cameras.py); without it cameras.json applies when present. "catalogue"
+# inspects every result of a station against a part catalogue
+# (inspection.py) and counts "passed"/"failed".
+
+DEFAULT_CONFIG_PATH = "stations.json"
+RECENT_RESULTS = 32
+
+class Station:
+    def __init__(self, name, top=0, side=2, profile=None, output=None, recording=None, track=True, max_skew=0.010,
+                 pyramid=0, cameras=None, catalogue=None):
+        self.name = name
+        self.levels = pyramid
+        self.profile = profile
+        self.ab_cm = profile["side"]["ab_cm"] if profile else AB_cm
+        self.live = recording is None
+        cap_top, cap_side = open_captures(top, side, recording, config=load_camera_config(cameras) if cameras else None)
+        self.synced_capture = SyncedCapture(cap_top, cap_side, max_skew=max_skew)
+        self.trackers = (RoiTracker(), RoiTracker()) if track and not pyramid else None
+        self.catalogue = load_catalogue(catalogue) if catalogue else None
+        self.output = open(output, "a") if output else None
+        self.results = collections.deque(maxlen=RECENT_RESULTS)
+        self.listeners = []
+        self.metrics = Instrumentation(enabled=True)
+        self.running = False
+        self.thread = None
+
+    def start(self, scheduler):
+        self.running = True
+        self.synced_capture.start()
+        self.thread = threading.Thread(target=self._feed, args=(scheduler,), daemon=True)
+        self.thread.start()
+        return self
+
+    def _feed(self, scheduler):
+        while self.running:
+            pair = self.synced_capture.read(timeout=0.5)
+            if pair is None:
+                continue
+            self.metrics.count("submitted")
+            if scheduler.submit(self, pair):
+                self.metrics.count("dropped")
+
+    # Called by the scheduler's workers, never concurrently for one station
+    def process(self, pair):
+        with self.metrics.stage("process"):
+            record = safe_measure_pair(pair.top, pair.side, self.ab_cm, self.profile, self.trackers, self.levels)
+        if self.live:
+            self.metrics.observe("latency", time.monotonic() - pair.top_time)
+        record["station"] = self.name
+        record["time"] = time.time()
+        if "error" in record:
+            self.metrics.count("errors")
+        if self.catalogue is not None:
+            inspect_record(record, self.catalogue)
+            self.metrics.count("passed" if record["pass"] else "failed")
+        self.publish(record)
+
+    def publish(self, record):
+        self.results.append(record)
+        if self.output:
+            self.output.write(json.dumps(record) + "\n")
+            self.output.flush()
+        for listener in self.listeners:
+            listener(record)
+
+    def stats(self):
+        snapshot = self.metrics.snapshot()
+        process = snapshot["stages"].get("process", {})
+        latency = snapshot["stages"].get("latency", {})
+        counters = snapshot["counters"]
+        return {
+            "measured_per_s": process.get("rate_hz", 0.0),
+            "process_p50_ms": process.get("p50_ms", 0.0),
+            "process_p95_ms": process.get("p95_ms", 0.0),
+            "latency_p50_ms": latency.get("p50_ms"),
+            "latency_p95_ms": latency.get("p95_ms"),
+            "submitted": counters.get("submitted", 0),
+            "dropped": counters.get("dropped", 0),
+            "errors": counters.get("errors", 0),
+            "passed": counters.get("passed", 0),
+            "failed": counters.get("failed", 0),
+        }
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.synced_capture.stop()
+        if self.output:
+            self.output.close()
+
+def load_stations(path=DEFAULT_CONFIG_PATH):
+    with open(path) as f:
+        config = json.load(f)
+    stations = []
+    for entry in config["stations"]:
+        entry = dict(entry)
+        if entry.get("profile"):
+            entry["profile"] = load_profile(entry["profile"])
+        stations.append(Station(**entry))
+    return stations, config.get("workers", os.cpu_count()), config.get("database")
+
+def format_stats(stations):
+    lines = [f"{'station':<12} {'meas/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'lat p95':>8} {'dropped':>8} {'errors':>7}"]
+    for station in stations:
+        s = station.stats()
+        latency = f"{s['latency_p95_ms']:8.1f}" if s["latency_p95_ms"] is not None else f"{'-':>8}"
+        lines.append(f"{station.name:<12} {s['measured_per_s']:7.1f} {s['process_p50_ms']:7.1f} "
+                     f"{s['process_p95_ms']:7.1f} {latency} {s['dropped']:8d} {s['errors']:7d}")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several inspection stations in one process.")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_PATH, help="station configuration file")
+    parser.add_argument("--workers", "-j", type=int, help="worker threads shared by all stations (overrides the config)")
+    parser.add_argument("--stats", metavar="PATH", help="also write per-station stats as JSON to this file")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between stats reports")
+    args = parser.parse_args(argv)
+
+    stations, workers, database = load_stations(args.config)
+    scheduler = FairScheduler(args.workers or workers).start()
+    store = ResultStore(database).start() if database else None
+    # Colour tables (segmentation.py) are built once, before the workers start
+    get_default_segmenter()
+    for station in stations:
+        if store is not None:
+            station.listeners.append(store.add)
+        station.start(scheduler)
+    try:
+        while True:
+            time.sleep(args.interval)
+            print(format_stats(stations), file=sys.stderr)
+            if args.stats:
+                write_atomic(args.stats, json.dumps({station.name: station.stats() for station in stations}, indent=2))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for station in stations:
+            station.stop()
+        scheduler.stop()
+        if store is not None:
+            store.close()
+
+if __name__ == "__main__":
+    main()
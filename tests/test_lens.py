@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import merged
+from benchmark import render_side_scene, render_top_scene
+from calibration import calibrate
+from lens import save_lens
+
+RESOLUTION = (640, 480)
+
+# A lens file with mild barrel distortion for frames of RESOLUTION
+def write_lens(path):
+    width, height = RESOLUTION
+    camera_matrix = [[600.0, 0.0, width / 2], [0.0, 600.0, height / 2], [0.0, 0.0, 1.0]]
+    save_lens({"lens_id": "test", "image_size": [width, height], "camera_matrix": camera_matrix,
+               "dist_coeffs": [-0.02, 0.0, 0.0, 0.0, 0.0], "new_camera_matrix": camera_matrix,
+               "rms_px": 0.0, "views": 0}, str(path))
+    return str(path)
+
+@pytest.mark.parametrize("levels", [0, 1])
+def test_measure_frames_with_lens_profile(tmp_path, monkeypatch, levels):
+    monkeypatch.setattr(merged, "PYRAMID_LEVELS", levels)
+    top_frame, top_truth = render_top_scene(RESOLUTION, 4)
+    side_frame, side_truth = render_side_scene(RESOLUTION)
+    lenses = (write_lens(tmp_path / "lens_top.json"), write_lens(tmp_path / "lens_side.json"))
+    profile = calibrate(top_frame, side_frame, merged.AB_cm, lenses)
+    assert profile["top"]["lens"] and profile["side"]["lens"]
+
+    result = merged.measure_frames(top_frame, side_frame, profile)
+    top_shape, top_dimensions, side_height = result[2], result[3], result[7]
+    assert top_shape == top_truth["part"][0]
+    assert np.allclose(sorted(top_dimensions), sorted(top_truth["part"][1]), atol=0.2)
+    # The profile's height offset is added to every side measurement
+    assert side_height == pytest.approx(side_truth + profile["side"]["offset_cm"], abs=0.2)
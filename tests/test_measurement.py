@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+import pytest
+
+import measurement
+from measurement import (
+    SHAPE_DTYPE,
+    classify_contours,
+    contour_stats,
+    find_longest_contiguous_black_line,
+    find_longest_contiguous_non_black_line,
+    vertical_run_profile,
+)
+
+# Longest run of set pixels in a column and the rows where runs that long start
+def column_runs(column):
+    longest, starts, run = 0, [], 0
+    for row, value in enumerate(column):
+        run = run + 1 if value else 0
+        if run > longest:
+            longest, starts = run, []
+        if run and run == longest:
+            starts.append(row - run + 1)
+    return longest, starts
+
+@pytest.mark.parametrize("shape, density", [((1, 1), 0.5), ((1, 17), 0.5), ((23, 1), 0.5),
+                                            ((40, 31), 0.2), ((40, 31), 0.5), ((40, 31), 0.9)])
+def test_vertical_run_profile_matches_brute_force(shape, density):
+    rng = np.random.default_rng(sum(shape))
+    for _ in range(20):
+        mask = (rng.random(shape) < density).astype(np.uint8) * 255
+        lengths, tops = vertical_run_profile(mask)
+        for col in range(shape[1]):
+            longest, starts = column_runs(mask[:, col] > 0)
+            assert lengths[col] == longest
+            # Any of the longest runs of a column may be reported
+            assert tops[col] in starts if longest else tops[col] == -1
+
+def test_vertical_run_profile_empty_and_full():
+    lengths, tops = vertical_run_profile(np.zeros((5, 3), dtype=np.uint8))
+    assert lengths.tolist() == [0, 0, 0] and tops.tolist() == [-1, -1, -1]
+    lengths, tops = vertical_run_profile(np.ones((5, 3), dtype=np.uint8))
+    assert lengths.tolist() == [5, 5, 5] and tops.tolist() == [0, 0, 0]
+
+def test_longest_lines():
+    binary = np.zeros((10, 4), dtype=np.uint8)
+    binary[2:9, 1] = 255
+    binary[0:3, 3] = 255
+    assert find_longest_contiguous_non_black_line(binary) == 7
+    assert find_longest_contiguous_black_line(binary) == 10
+
+# Contours of rectangles, circles and random polygons, plus degenerate ones
+# (a point, a line) that findContours also returns for thin specks
+def scene_contours():
+    rng = np.random.default_rng(7)
+    image = np.zeros((400, 600), dtype=np.uint8)
+    for k in range(40):
+        x, y = 15 * k % 570 + 5, 100 * (k % 4) + 10
+        if k % 3 == 0:
+            cv2.rectangle(image, (x, y), (x + int(rng.integers(3, 12)), y + int(rng.integers(3, 60))), 255, -1)
+        elif k % 3 == 1:
+            cv2.circle(image, (x + 6, y + 30), int(rng.integers(2, 7)), 255, -1)
+        else:
+            points = rng.integers(0, 12, size=(5, 2)) + (x, y + 20)
+            cv2.fillPoly(image, [points.astype(np.int32)], 255)
+    contours, _ = cv2.findContours(image, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    return list(contours) + [np.array([[[3, 4]]], dtype=np.int32), np.array([[[1, 1]], [[9, 1]]], dtype=np.int32)]
+
+def test_contour_stats_matches_opencv():
+    contours = scene_contours()
+    areas, perimeters, boxes, centroids = contour_stats(contours)
+    for contour, area, perimeter, box, centroid in zip(contours, areas, perimeters, boxes, centroids):
+        assert area == pytest.approx(cv2.contourArea(contour))
+        assert perimeter == pytest.approx(cv2.arcLength(contour, True))
+        assert tuple(box) == cv2.boundingRect(contour)
+        moments = cv2.moments(contour)
+        if moments["m00"]:
+            assert centroid == pytest.approx((moments["m10"] / moments["m00"], moments["m01"] / moments["m00"]))
+
+@pytest.mark.parametrize("keep_unclassified", [False, True])
+def test_batched_and_per_contour_classification_agree(monkeypatch, keep_unclassified):
+    contours = scene_contours()
+    stats = contour_stats(contours)
+    results = []
+    for threshold in (0, len(contours) + 1):
+        monkeypatch.setattr(measurement, "BATCH_MIN_CONTOURS", threshold)
+        results.append(classify_contours(contours, 10.0, stats, min_area=2, keep_unclassified=keep_unclassified))
+    batched, per_contour = results
+    assert {measurement.SHAPE_RECTANGLE, measurement.SHAPE_CIRCLE} <= set(batched["shape"].tolist())
+    assert batched.dtype == per_contour.dtype == SHAPE_DTYPE
+    for name in SHAPE_DTYPE.names:
+        np.testing.assert_allclose(batched[name], per_contour[name], rtol=1e-6, err_msg=name)
@@ -0,0 +1,92 @@
+import cv2
+
+from calibration import pad_roi
+from measurement import process_top_frame, calculate_object_height, find_side_reference_pixels
+
+# ROI tracking between consecutive frames.
+#
+# Once the black box (top view) or the object (side view) has been found on a
+# full frame, later frames are processed only inside a padded window around
+# its last position. The full frame is searched again whenever the target is
+# lost, touches the edge of the window or changes size too much, since any of
+# those means it may extend beyond the window.
+
+class RoiTracker:
+    def __init__(self, padding=40, size_tolerance=0.2):
+        self.padding = padding
+        self.size_tolerance = size_tolerance
+        self.box = None
+        self.ab_pixels = None
+        self.reacquisitions = 0
+        self.tracked_frames = 0
+
+    # Padded search window for the next frame, or None when not locked
+    def window(self, frame_shape):
+        if self.box is None:
+            return None
+        return pad_roi(self.box, self.padding, frame_shape)
+
+    # box is in frame coordinates, window is the search window it came from.
+    # Touching the window edge only counts where the window is not the frame edge.
+    def accepts(self, box, window, frame_shape):
+        x, y, w, h = box
+        wx, wy, ww, wh = window
+        if w == 0 or h == 0:
+            return False
+        frame_h, frame_w = frame_shape[:2]
+        on_edge = (x <= wx and wx > 0) or (y <= wy and wy > 0) or \
+                  (x + w >= wx + ww and wx + ww < frame_w) or (y + h >= wy + wh and wy + wh < frame_h)
+        if on_edge:
+            return False
+        last_w, last_h = self.box[2], self.box[3]
+        return abs(w / last_w - 1) <= self.size_tolerance and abs(h / last_h - 1) <= self.size_tolerance
+
+    def lock(self, box):
+        self.box = tuple(int(v) for v in box)
+
+    def reset(self):
+        self.box = None
+
+def track_top_frame(frame, tracker):
+    window = tracker.window(frame.shape)
+    if window is not None:
+        wx, wy, ww, wh = window
+        try:
+            result = process_top_frame(frame[wy:wy+wh, wx:wx+ww])
+        except ValueError:  # No contours at all inside the window
+            result = None
+        if result is not None:
+            x, y, w, h = result[6:]
+            box = (x + wx, y + wy, w, h)
+            if tracker.accepts(box, window, frame.shape):
+                tracker.lock(box)
+                tracker.tracked_frames += 1
+                return result[:6] + box
+    tracker.reacquisitions += 1
+    result = process_top_frame(frame)
+    tracker.lock(result[6:])
+    return result
+
+# The side reference is measured on the full frame when the object is
+# (re)acquired and reused while tracking, unless ab_pixels is given
+def track_side_frame(frame, tracker, AB_cm, additional_distance_cm, ab_pixels=None):
+    window = tracker.window(frame.shape)
+    if window is not None and (ab_pixels or tracker.ab_pixels):
+        wx, wy, ww, wh = window
+        height_cm, mask = calculate_object_height(frame[wy:wy+wh, wx:wx+ww], AB_cm, additional_distance_cm,
+                                                  ab_pixels or tracker.ab_pixels)
+        x, y, w, h = cv2.boundingRect(mask)
+        if tracker.accepts((x + wx, y + wy, w, h), window, frame.shape):
+            tracker.lock((x + wx, y + wy, w, h))
+            tracker.tracked_frames += 1
+            return height_cm, mask
+    tracker.reacquisitions += 1
+    if ab_pixels is None:
+        ab_pixels = tracker.ab_pixels = find_side_reference_pixels(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY))
+    height_cm, mask = calculate_object_height(frame, AB_cm, additional_distance_cm, ab_pixels)
+    box = cv2.boundingRect(mask)
+    if box[2] and box[3]:
+        tracker.lock(box)
+    else:
+        tracker.reset()
+    return height_cm, mask